@@ -1,8 +1,16 @@
+import os
+import json
 import math
+import base64
+import threading
+import urllib.parse
+import urllib.request
 
-from typing import List, Tuple
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
 
 from endstone.command import Command, CommandSender, CommandExecutor
+from endstone.level import Dimension
 from endstone.plugin import Plugin
 
 
@@ -14,11 +22,22 @@ class MapLoader():
         self.messages: dict = self.plugin.config.get("messages", {})
         self.areasQueue: List[Tuple[int, int, int, int, str]] = []
 
+        mapLoading: dict = self.plugin.config.get("mapLoading", {})
+        self.skipRendered = mapLoading.get("skipRendered", True)
+        self.checkpointPath = Path(self.plugin.data_folder) / "loadmap.json"
+
+        api: dict = self.plugin.config.get("api", {})
+        self.manifestUrl = api.get("manifest", f"{api.get('chunks')}/manifest")
+
         self.batchId = 0
         self.totalBatches = 0
         self.completedBatches = 0
+        self.failedAreas = 0
+
+        self._checkpoint: Optional[dict] = None
+        self._manifest: Optional[dict] = None
         
-    def startLoading(self, minX: int, minZ: int, maxX: int, maxZ: int, batchSize: int, maxAreas: int) -> None:
+    def startLoading(self, minX: int, minZ: int, maxX: int, maxZ: int, batchSize: int, maxAreas: int, completed: Iterable[str] = ()) -> None:
         if self.isLoading:
             self.plugin.logger.warning(self.messages.get("mapLoadingAlreadyRunning"))
             return
@@ -27,6 +46,11 @@ class MapLoader():
         self.areasQueue = []
         self.maxAreas = maxAreas
         self.completedBatches = 0
+        self.failedAreas = 0
+
+        completed = set(completed)
+        self._checkpoint = {"bounds": [minX, minZ, maxX, maxZ], "batchSize": batchSize, "completed": sorted(completed)}
+        self._saveCheckpoint()
         
         areaCount = 0
         for x in range(minX, maxX, batchSize):
@@ -36,18 +60,135 @@ class MapLoader():
 
                 areaId = f"loadmap-{areaCount}"
 
-                self.areasQueue.append((x, z, endX, endZ, areaId))
+                if areaId not in completed:
+                    self.areasQueue.append((x, z, endX, endZ, areaId))
                 areaCount += 1
-        
-        self.totalBatches = math.ceil(areaCount / maxAreas)
-        
-        self.plugin.logger.info(self.messages.get("mapLoadingStartedLog").format(areaCount=areaCount))
+
+        self.plugin.logger.info(self.messages.get("mapLoadingStartedLog").format(areaCount=len(self.areasQueue)))
+
+        if not self.skipRendered:
+            self._planBatches()
+            return
+
+        # The manifest is fetched off the server thread; planning resumes once it arrives.
+        self._manifest = None
+        bounds = (minX >> 4, minZ >> 4, (maxX - 1) >> 4, (maxZ - 1) >> 4)
+        threading.Thread(target=self._fetchManifest, args=(bounds,), daemon=True).start()
+        self.plugin.server.scheduler.run_task(self.plugin, self._awaitManifest, 5)
+
+    def resumeLoading(self, maxAreas: int) -> bool:
+        try:
+            checkpoint = json.loads(self.checkpointPath.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return False
+
+        minX, minZ, maxX, maxZ = checkpoint["bounds"]
+        self.startLoading(minX, minZ, maxX, maxZ, checkpoint["batchSize"], maxAreas, checkpoint["completed"])
+
+        return True
+
+    def _fetchManifest(self, bounds: Tuple[int, int, int, int]) -> None:
+        minChunkX, minChunkZ, maxChunkX, maxChunkZ = bounds
+        query = urllib.parse.urlencode({
+            "dimension": self._dimensionName(),
+            "minX": minChunkX, "minZ": minChunkZ, "maxX": maxChunkX, "maxZ": maxChunkZ
+        })
+
+        try:
+            with urllib.request.urlopen(f"{self.manifestUrl}?{query}", timeout=10) as response:
+                manifest = json.loads(response.read())
+
+            regionSize = manifest["regionSize"]
+            self._manifest = {
+                "regionSize": regionSize,
+                "regions": {(region["x"], region["z"]): base64.b64decode(region["bitmap"]) for region in manifest["regions"]}
+            }
+
+        except Exception as e:
+            self._manifest = {"regionSize": 0, "regions": {}, "error": str(e)}
+
+    def _dimensionName(self) -> str:
+        # Ticking areas added from the console live in the overworld.
+        for dimension in self.plugin.server.level.dimensions:
+            if dimension.type == Dimension.Type.OVERWORLD:
+                return dimension.name
+
+        return "Overworld"
+
+    def _awaitManifest(self) -> None:
+        if not self.isLoading:
+            return
+
+        if self._manifest is None:
+            self.plugin.server.scheduler.run_task(self.plugin, self._awaitManifest, 5)
+            return
+
+        if "error" in self._manifest:
+            self.plugin.logger.warning(self.messages.get(
+                "manifestUnavailable", "Could not get rendered chunks from the web server, loading every area: {error}"
+            ).format(error=self._manifest["error"]))
+
+        pending = []
+        for area in self.areasQueue:
+            if self._isRendered(area):
+                self._checkpoint["completed"].append(area[4])
+            else:
+                pending.append(area)
+
+        skipped = len(self.areasQueue) - len(pending)
+        if skipped:
+            self.plugin.logger.info(self.messages.get(
+                "areasSkipped", "Skipped {skipped} areas that are already rendered. Remaining: {remaining}"
+            ).format(skipped=skipped, remaining=len(pending)))
+            self._saveCheckpoint()
+
+        self.areasQueue = pending
+        self._planBatches()
+
+    def _isRendered(self, area: Tuple[int, int, int, int, str]) -> bool:
+        regionSize = self._manifest["regionSize"]
+        if not regionSize:
+            return False
+
+        minX, minZ, maxX, maxZ, _ = area
+        shift = regionSize.bit_length() - 1
+
+        for chunkX in range(minX >> 4, ((maxX - 1) >> 4) + 1):
+            for chunkZ in range(minZ >> 4, ((maxZ - 1) >> 4) + 1):
+                bitmap = self._manifest["regions"].get((chunkX >> shift, chunkZ >> shift))
+                bit = (chunkZ & (regionSize - 1)) * regionSize + (chunkX & (regionSize - 1))
+
+                if bitmap is None or not bitmap[bit >> 3] & (1 << (bit & 7)):
+                    return False
+
+        return True
+
+    def _planBatches(self) -> None:
+        self.totalBatches = math.ceil(len(self.areasQueue) / self.maxAreas)
         self._nextBatch()
 
+    def _saveCheckpoint(self) -> None:
+        try:
+            self.checkpointPath.parent.mkdir(parents=True, exist_ok=True)
+            tempPath = self.checkpointPath.with_suffix(".tmp")
+            tempPath.write_text(json.dumps(self._checkpoint), encoding="utf-8")
+            os.replace(tempPath, self.checkpointPath)
+
+        except OSError as e:
+            self.plugin.logger.warning(f"Could not save /loadmap checkpoint: {e}")
+
     def _nextBatch(self) -> None:
         if not self.areasQueue:
             self._finishLoading()
             return
+
+        queueSize, maxQueueSize = self.plugin.renderQueue
+        if maxQueueSize and queueSize >= maxQueueSize:
+            self.plugin.logger.info(self.messages.get(
+                "waitingForRenderQueue", "Render queue is full ({queueSize}/{maxQueueSize}), waiting before the next batch"
+            ).format(queueSize=queueSize, maxQueueSize=maxQueueSize))
+            self.plugin.server.scheduler.run_task(self.plugin, self._nextBatch, 100)
+            return
         
         batch = []
         for _ in range(min(self.maxAreas, len(self.areasQueue))):
@@ -77,13 +218,27 @@ class MapLoader():
         self.plugin.batchTracker.startBatch(
             batchId=self.batchId,
             areas=batch,
-            onComplete=lambda: self._removeBatch(batch)
+            onComplete=lambda rendered: self._removeBatch(batch, rendered),
+            onStalled=self._rescanChunks
         )
 
-    def _removeBatch(self, batch: List[Tuple[int, int, int, int, str]]) -> None:
+    def _rescanChunks(self, chunks: Iterable[Tuple[int, int]]) -> None:
+        dimensionName = self._dimensionName()
+
+        for chunkX, chunkZ in chunks:
+            self.plugin.scanScheduler.schedule((dimensionName, chunkX, chunkZ), pinned=True)
+
+    def _removeBatch(self, batch: List[Tuple[int, int, int, int, str]], rendered: bool = True) -> None:
         for _, _, _, _, areaId in batch:
             command = f"tickingarea remove {areaId}"
             self.plugin.server.dispatch_command(self.plugin.server.command_sender, command)
+
+        # Areas given up on stay out of the checkpoint so /loadmap resume retries them.
+        if rendered:
+            self._checkpoint["completed"].extend(areaId for _, _, _, _, areaId in batch)
+            self._saveCheckpoint()
+        else:
+            self.failedAreas += len(batch)
         
         self.plugin.logger.info(self.messages.get("batchProcessed").format(batchSize=len(batch)))
         
@@ -92,6 +247,14 @@ class MapLoader():
     def _finishLoading(self) -> None:
         self.isLoading = False
         self.plugin.batchTracker.cancelBatch()
+
+        if self.failedAreas:
+            self.plugin.logger.warning(self.messages.get(
+                "mapLoadingIncomplete", "Map loading finished, but {areas} areas were not fully rendered. Use /loadmap resume to retry them"
+            ).format(areas=self.failedAreas))
+            return
+
+        self.checkpointPath.unlink(missing_ok=True)
         self.plugin.logger.info(self.messages.get("mapLoadingFinished"))
 
 
@@ -124,12 +287,43 @@ class LoadmapCommand(CommandExecutor):
             self.mapLoader.startLoading(minX, minZ, maxX, maxZ, self.batchSize, self.maxAreas)
             sender.send_message(self.messages.get("loadingStarted").format(minX=minX, minZ=minZ, maxX=maxX, maxZ=maxZ))
                 
+        elif args[0].lower() == "resume":
+            if self.mapLoader.isLoading:
+                sender.send_message(self.messages.get("mapLoadingAlreadyRunning"))
+                return True
+
+            self.clearAreas()
+
+            if self.mapLoader.resumeLoading(self.maxAreas):
+                sender.send_message(self.messages.get("loadingResumed", "Map loading resumed from the last checkpoint"))
+            else:
+                sender.send_message(self.messages.get("noCheckpoint", "There is no interrupted map loading to resume"))
+
         elif args[0].lower() == "status":
             if self.mapLoader.isLoading:
                 remaining = len(self.mapLoader.areasQueue)
                 sender.send_message(self.messages.get("loadingInProgress").format(remaining=remaining))
             else:
                 sender.send_message(self.messages.get("loadingNotRunning"))
+
+            queueSize, maxQueueSize = self.plugin.renderQueue
+            sender.send_message(self.messages.get(
+                "renderQueueStatus", "Render queue: {queueSize}/{maxQueueSize} chunks"
+            ).format(queueSize=queueSize, maxQueueSize=maxQueueSize))
+
+            scanner = self.plugin.scanScheduler
+            sender.send_message(self.messages.get(
+                "scanStatus",
+                "Chunk scans pending: {pending}, last tick: {scans} in {ms:.2f} ms, "
+                "total: {totalScans} in {totalMs:.0f} ms, back-off ticks: {backoffTicks}"
+            ).format(
+                pending=len(scanner),
+                scans=scanner.scansLastTick,
+                ms=scanner.msLastTick,
+                totalScans=scanner.totalScans,
+                totalMs=scanner.totalMs,
+                backoffTicks=scanner.backoffTicks
+            ))
                 
         elif len(args) == 4:
             self.clearAreas()
@@ -146,6 +340,7 @@ class LoadmapCommand(CommandExecutor):
             sender.send_message(self.messages.get("helpUsage"))
             sender.send_message(self.messages.get("helpDefault"))
             sender.send_message(self.messages.get("helpCustom"))
+            sender.send_message(self.messages.get("helpResume", "/loadmap resume - continue the last interrupted loading"))
             sender.send_message(self.messages.get("helpStatus"))
             sender.send_message(self.messages.get("helpInfo"))
             
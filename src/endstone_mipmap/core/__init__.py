@@ -1,6 +1,9 @@
 from .tracker import BatchTracker
+from .chunkQueue import ChunkQueue
+from .columnTracker import ColumnTracker
+from .scanScheduler import ScanScheduler
 from .chunksSender import ChunksSender
 from .playersSender import PlayersSender
 
 
-__all__ = ["BatchTracker", "ChunksSender", "PlayersSender"]
\ No newline at end of file
+__all__ = ["BatchTracker", "ChunkQueue", "ColumnTracker", "ScanScheduler", "ChunksSender", "PlayersSender"]
\ No newline at end of file
@@ -0,0 +1,89 @@
+import struct
+import hashlib
+
+from typing import List
+
+
+CHUNK_MAGIC = b"MMCK"
+CHUNK_FORMAT_VERSION = 1
+CHUNK_BLOCKS = 256
+
+BATCH_MAGIC = b"MMCB"
+BATCH_FORMAT_VERSION = 1
+
+_headerStruct = struct.Struct("<4sBii")
+_heightsStruct = struct.Struct(f"<{CHUNK_BLOCKS}h")
+_batchHeaderStruct = struct.Struct("<4sBH")
+_frameLengthStruct = struct.Struct("<I")
+
+
+def _packString(value: str) -> bytes:
+    encoded = value.encode("utf-8")
+    return struct.pack("<B", len(encoded)) + encoded
+
+
+def encodeChunk(chunk: dict) -> bytes:
+    palette: List[str] = chunk.get("palette")
+
+    parts = [
+        _headerStruct.pack(CHUNK_MAGIC, CHUNK_FORMAT_VERSION, chunk.get("chunkX"), chunk.get("chunkZ")),
+        _packString(chunk.get("dimension")),
+        struct.pack("<H", len(palette)),
+    ]
+    parts.extend(_packString(name) for name in palette)
+    parts.append(bytes(chunk.get("indices")))
+    parts.append(_heightsStruct.pack(*chunk.get("heights")))
+
+    return b"".join(parts)
+
+
+def chunkFingerprint(chunk: dict) -> str:
+    # Same canonical form as the web server: the sorted names in use and the
+    # indices remapped onto them, so the palette order does not matter.
+    palette = chunk.get("palette")
+    indices = bytes(chunk.get("indices"))
+
+    names = sorted({palette[i] for i in set(indices)})
+    rank = {name: n for n, name in enumerate(names)}
+    table = bytes(rank.get(name, 0) for name in palette).ljust(256, b"\0")
+
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update("\n".join(names).encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(indices.translate(table))
+    digest.update(_heightsStruct.pack(*chunk.get("heights")))
+
+    return digest.hexdigest()
+
+
+def chunkToJson(chunk: dict) -> dict:
+    palette = chunk.get("palette")
+    indices = chunk.get("indices")
+    heights = chunk.get("heights")
+
+    startX = chunk.get("chunkX") * 16
+    startZ = chunk.get("chunkZ") * 16
+
+    blocks = []
+    for dx in range(16):
+        for dz in range(16):
+            i = dz * 16 + dx
+            blocks.append({
+                "name": palette[indices[i]],
+                "coordinates": [startX + dx, heights[i], startZ + dz]
+            })
+
+    return {
+        "dimension": chunk.get("dimension"),
+        "blocks": blocks
+    }
+
+
+def encodeChunkBatch(frames: List[bytes]) -> bytes:
+    parts = [_batchHeaderStruct.pack(BATCH_MAGIC, BATCH_FORMAT_VERSION, len(frames))]
+
+    for frame in frames:
+        parts.append(_frameLengthStruct.pack(len(frame)))
+        parts.append(frame)
+
+    return b"".join(parts)
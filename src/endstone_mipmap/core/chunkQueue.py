@@ -0,0 +1,75 @@
+import queue
+import itertools
+
+import multiprocessing as mp
+
+from collections import OrderedDict
+from typing import Hashable
+
+
+class ChunkQueue:
+    def __init__(self, handoff: mp.Queue, maxChunks: int):
+        self.handoff = handoff
+        self.maxChunks = maxChunks
+
+        self._sequence = itertools.count()
+        self._chunks = OrderedDict()
+        self._pinnedChunks = OrderedDict()
+
+        self.coalesced = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._chunks) + len(self._pinnedChunks)
+
+    def push(self, key: Hashable, chunkData: dict, pinned: bool = False) -> None:
+        if key in self._pinnedChunks:
+            sequence, _ = self._pinnedChunks[key]
+            self._pinnedChunks[key] = (sequence, chunkData)
+            self.coalesced += 1
+            return
+
+        if key in self._chunks:
+            self.coalesced += 1
+
+            if not pinned:
+                sequence, _ = self._chunks[key]
+                self._chunks[key] = (sequence, chunkData)
+                return
+
+            del self._chunks[key]
+
+        target = self._pinnedChunks if pinned else self._chunks
+        target[key] = (next(self._sequence), chunkData)
+
+        while len(self) > self.maxChunks and self._chunks:
+            self._chunks.popitem(last=False)
+            self.dropped += 1
+
+    def pump(self) -> int:
+        sent = 0
+
+        while len(self):
+            pending = self._oldest()
+            key, (_, chunkData) = next(iter(pending.items()))
+
+            try:
+                self.handoff.put_nowait(chunkData)
+            except queue.Full:
+                break
+
+            del pending[key]
+            sent += 1
+
+        return sent
+
+    def _oldest(self) -> OrderedDict:
+        if not self._pinnedChunks:
+            return self._chunks
+        if not self._chunks:
+            return self._pinnedChunks
+
+        chunkSequence, _ = next(iter(self._chunks.values()))
+        pinnedSequence, _ = next(iter(self._pinnedChunks.values()))
+
+        return self._chunks if chunkSequence < pinnedSequence else self._pinnedChunks
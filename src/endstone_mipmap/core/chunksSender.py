@@ -1,45 +1,298 @@
+import json
+import time
+import queue
 import asyncio
 import aiohttp
 
 import multiprocessing as mp
 
+from pathlib import Path
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from .chunkCodec import encodeChunk, encodeChunkBatch, chunkToJson, chunkFingerprint
+from .fingerprints import FingerprintStore
+
 
 class ChunksSender:
-    def __init__(self, config: dict, resultQueue: mp.Queue):
+    def __init__(self, config: dict, resultQueue: mp.Queue, fingerprintsPath: Optional[Path] = None):
         self.timeout = 5
         self.resultQueue = resultQueue
-        self.url = config.get("api").get("chunks")
-        
-    async def _sendChunkData(self, session: aiohttp.ClientSession, data: dict) -> None:
-        chunkX = data.get("chunkX")
-        chunkZ = data.get("chunkZ")
-        
-        payload = {"chunk": data.get("chunk")}
-        
+
+        api: dict = config.get("api")
+        self.url = api.get("chunksBatch", f"{api.get('chunks')}/batch")
+        self.format = api.get("chunksFormat", "json")
+        self.columnsUrl = api.get("columns", f"{api.get('chunks')}/columns")
+        self.renderedUrl = api.get("rendered", f"{api.get('chunks')}/rendered")
+
+        senderConfig: dict = config.get("chunksSender", {})
+        self.maxBatchChunks = senderConfig.get("maxBatchChunks", 32)
+        self.maxBatchBytes = senderConfig.get("maxBatchBytes", 262144)
+        self.linger = senderConfig.get("lingerMs", 50) / 1000
+        self.maxInFlight = senderConfig.get("maxInFlight", 4)
+        self.renderAcks = senderConfig.get("waitForRender", True)
+        self.traceFreshness = senderConfig.get("traceFreshness", True)
+        self.pollTimeout = 25
+
+        # Chunks the web server has queued but not rendered yet, kept so they
+        # can be sent again if it restarts and loses its queue.
+        self.awaitingRender: "OrderedDict[tuple, Tuple[Tuple[int, int, tuple, str], bytes]]" = OrderedDict()
+        self.maxAwaitingRender = senderConfig.get("queueLimit", 4096)
+
+        self._deferredColumns: Optional[dict] = None
+
+        self.fingerprints = None
+        if fingerprintsPath and senderConfig.get("skipUnchanged", True):
+            self.fingerprints = FingerprintStore(fingerprintsPath)
+
+    def _encodeChunk(self, chunk: dict) -> bytes:
+        if self.format == "binary":
+            return encodeChunk(chunk)
+
+        return json.dumps(chunkToJson(chunk)).encode("utf-8")
+
+    def _buildRequest(self, frames: List[bytes], traces: List[Optional[list]]) -> dict:
+        if self.format == "binary":
+            request = {
+                "url": self.url,
+                "data": encodeChunkBatch(frames),
+                "headers": {"Content-Type": "application/octet-stream"}
+            }
+        else:
+            request = {
+                "url": self.url,
+                "data": b'{"chunks":[' + b",".join(frames) + b"]}",
+                "headers": {"Content-Type": "application/json"}
+            }
+
+        if any(trace is not None for trace in traces):
+            trace = {"sentAt": round(time.time(), 3), "chunks": traces}
+            request["headers"]["X-MipMap-Trace"] = json.dumps(trace, separators=(",", ":"))
+
+        return request
+
+    def _reportBatch(self, coords: List[Tuple[int, int, tuple, str]], status: str) -> None:
+        for chunkX, chunkZ, _, _ in coords:
+            self.resultQueue.put((status, chunkX, chunkZ))
+
+    def _isUnchanged(self, chunkData: dict, chunkKey: tuple, fingerprint: str) -> bool:
+        if self.fingerprints is None or chunkData.get("pinned"):
+            return False
+
+        return self.fingerprints.get(chunkKey) == fingerprint
+
+    async def _sendBatch(self, session: aiohttp.ClientSession, coords: List[Tuple[int, int, tuple, str]], frames: List[bytes], traces: List[Optional[list]]) -> None:
+        request = self._buildRequest(frames, traces)
+
         try:
-            async with session.post(self.url, json=payload, timeout=self.timeout) as response:
+            async with session.post(**request, timeout=self.timeout) as response:
                 if response.status == 200:
-                    self.resultQueue.put(("success", chunkX, chunkZ))
+                    results = (await response.json()).get("results", [])
+
+                    for coord, frame, result in zip(coords, frames, results):
+                        chunkX, chunkZ, chunkKey, fingerprint = coord
+                        status = result.get("status")
+
+                        if status != "success":
+                            self.resultQueue.put((status, chunkX, chunkZ))
+                            print(f"[Mipmap] Chunk ({chunkX}, {chunkZ}) rejected: {result.get('detail')}")
+                            continue
+
+                        # Unchanged chunks are already on the map; the rest are rendered later.
+                        rendered = result.get("unchanged") or not self.renderAcks
+                        self.resultQueue.put(("rendered" if rendered else "queued", chunkX, chunkZ))
+
+                        # A fingerprint is saved only once the chunk is drawn, so a chunk
+                        # lost in the render queue is not skipped the next time it is sent.
+                        if not rendered:
+                            self._awaitRender(coord, frame)
+
+                        elif result.get("unchanged") and self.fingerprints is not None:
+                            self.fingerprints.put(chunkKey, fingerprint)
+
+                    self._reportBatch(coords[len(results):], "error")
+
+                    if self.fingerprints is not None:
+                        self.fingerprints.commit()
 
                 else:
                     errorText = await response.text()
-                    self.resultQueue.put(("error", chunkX, chunkZ))
+                    self._reportBatch(coords, "error")
+
+                    print(f"[Mipmap] HTTP error {response.status} for batch of {len(coords)} chunks: {errorText}")
 
-                    print(f"[Mipmap] HTTP error {response.status} for chunk ({chunkX}, {chunkZ}): {errorText}")
-                
         except aiohttp.ClientError as e:
-            print(f"[Mipmap] Network error sending chunk ({chunkX}, {chunkZ}): {e}")
-            self.resultQueue.put(("error", chunkX, chunkZ))
-        
+            print(f"[Mipmap] Network error sending batch of {len(coords)} chunks: {e}")
+            self._reportBatch(coords, "error")
+
         except asyncio.TimeoutError as e:
-            print(f"[Mipmap] Timeout sending chunk ({chunkX}, {chunkZ}): {e}")
-            self.resultQueue.put(("error", chunkX, chunkZ))
-            
+            print(f"[Mipmap] Timeout sending batch of {len(coords)} chunks: {e}")
+            self._reportBatch(coords, "error")
+
+    def _awaitRender(self, coord: Tuple[int, int, tuple, str], frame: bytes) -> None:
+        chunkKey = coord[2]
+
+        self.awaitingRender.pop(chunkKey, None)
+        self.awaitingRender[chunkKey] = (coord, frame)
+
+        while len(self.awaitingRender) > self.maxAwaitingRender:
+            self.awaitingRender.popitem(last=False)
+
+    async def _resendAwaiting(self, session: aiohttp.ClientSession) -> None:
+        awaiting = list(self.awaitingRender.values())
+        self.awaitingRender.clear()
+
+        print(f"[Mipmap] Web server restarted, sending {len(awaiting)} chunks that were not rendered yet again")
+
+        for start in range(0, len(awaiting), self.maxBatchChunks):
+            batch = awaiting[start:start + self.maxBatchChunks]
+            await self._sendBatch(session, [coord for coord, _ in batch], [frame for _, frame in batch], [None] * len(batch))
+
+    async def _sendColumns(self, session: aiohttp.ClientSession, columns: dict) -> None:
+        chunkX = columns.get("chunkX")
+        chunkZ = columns.get("chunkZ")
+
+        try:
+            async with session.post(self.columnsUrl, json=columns, timeout=self.timeout) as response:
+                if response.status != 200:
+                    errorText = await response.text()
+                    print(f"[Mipmap] HTTP error {response.status} for column update ({chunkX}, {chunkZ}): {errorText}")
+
+        except aiohttp.ClientError as e:
+            print(f"[Mipmap] Network error sending column update ({chunkX}, {chunkZ}): {e}")
+
+        except asyncio.TimeoutError as e:
+            print(f"[Mipmap] Timeout sending column update ({chunkX}, {chunkZ}): {e}")
+
+    async def _pollRendered(self, session: aiohttp.ClientSession) -> None:
+        cursor = -1
+
+        while self.renderAcks:
+            try:
+                params = {"after": cursor, "timeout": self.pollTimeout}
+
+                async with session.get(self.renderedUrl, params=params, timeout=self.pollTimeout + self.timeout) as response:
+                    if response.status == 404:
+                        print("[Mipmap] Web server does not report rendered chunks, /loadmap will not wait for rendering")
+                        self.renderAcks = False
+                        return
+
+                    if response.status != 200:
+                        errorText = await response.text()
+                        print(f"[Mipmap] HTTP error {response.status} for rendered chunks: {errorText}")
+                        await asyncio.sleep(self.timeout)
+                        continue
+
+                    rendered = await response.json()
+
+                # A cursor that went back means the web server restarted and
+                # dropped whatever was still waiting in its render queue.
+                restarted = 0 <= rendered.get("cursor", cursor) < cursor
+                cursor = rendered.get("cursor", cursor)
+
+                for dimension, chunkX, chunkZ in rendered.get("chunks", []):
+                    awaiting = self.awaitingRender.pop((dimension, chunkX, chunkZ), None)
+                    self.resultQueue.put(("rendered", chunkX, chunkZ))
+
+                    if awaiting is not None and self.fingerprints is not None:
+                        coord, _ = awaiting
+                        self.fingerprints.put(coord[2], coord[3])
+
+                if self.fingerprints is not None:
+                    self.fingerprints.commit()
+
+                if restarted and self.awaitingRender:
+                    await self._resendAwaiting(session)
+
+                self.resultQueue.put(("queue", rendered.get("queueSize", 0), rendered.get("maxQueueSize", 0)))
+
+            except aiohttp.ClientError as e:
+                print(f"[Mipmap] Network error polling rendered chunks: {e}")
+                await asyncio.sleep(self.timeout)
+
+            except asyncio.TimeoutError:
+                continue
+
+    async def _collectBatch(self, chunksQueue: mp.Queue) -> Tuple[List[Tuple[int, int, tuple, str]], List[bytes], List[Optional[list]], Optional[dict]]:
+        coords = []
+        frames = []
+        traces = []
+        batchBytes = 0
+        deadline = None
+
+        # A column update is a request of its own; one that arrived while a
+        # batch was filling goes out right after that batch.
+        if self._deferredColumns is not None:
+            columns, self._deferredColumns = self._deferredColumns, None
+            return coords, frames, traces, columns
+
+        while len(frames) < self.maxBatchChunks and batchBytes < self.maxBatchBytes:
+            try:
+                chunkData = chunksQueue.get_nowait()
+
+            except queue.Empty:
+                if deadline is None:
+                    await asyncio.sleep(0.1)
+                    continue
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+
+                await asyncio.sleep(min(remaining, 0.01))
+                continue
+
+            if "columns" in chunkData:
+                if not frames:
+                    return coords, frames, traces, chunkData.get("columns")
+
+                self._deferredColumns = chunkData.get("columns")
+                break
+
+            dequeuedAt = time.time()
+            chunk = chunkData.get("chunk")
+            chunkX = chunkData.get("chunkX")
+            chunkZ = chunkData.get("chunkZ")
+
+            try:
+                chunkKey = (chunk.get("dimension"), chunkX, chunkZ)
+                fingerprint = chunkFingerprint(chunk)
+
+                if self._isUnchanged(chunkData, chunkKey, fingerprint):
+                    continue
+
+                frame = self._encodeChunk(chunk)
+
+            except Exception as e:
+                print(f"[Mipmap] Failed to encode chunk ({chunkX}, {chunkZ}): {e}")
+                self.resultQueue.put(("error", chunkX, chunkZ))
+                continue
+
+            coords.append((chunkX, chunkZ, chunkKey, fingerprint))
+            frames.append(frame)
+            batchBytes += len(frame)
+
+            trace = chunkData.get("trace")
+            traces.append([round(stamp, 3) for stamp in (*trace, dequeuedAt)] if trace and self.traceFreshness else None)
+
+            if deadline is None:
+                deadline = time.monotonic() + self.linger
+
+        return coords, frames, traces, None
+
     async def run(self, queue: mp.Queue) -> None:
+        inFlight = asyncio.Semaphore(self.maxInFlight)
+
         async with aiohttp.ClientSession() as session:
+            poller = asyncio.create_task(self._pollRendered(session))
+
             while True:
-                if not queue.empty():
-                    chunkData = queue.get()
-                    asyncio.create_task(self._sendChunkData(session, chunkData))
+                await inFlight.acquire()
+                coords, frames, traces, columns = await self._collectBatch(queue)
+
+                if columns is not None:
+                    task = asyncio.create_task(self._sendColumns(session, columns))
                 else:
-                    await asyncio.sleep(0.1)
+                    task = asyncio.create_task(self._sendBatch(session, coords, frames, traces))
+
+                task.add_done_callback(lambda _: inFlight.release())
@@ -0,0 +1,44 @@
+import threading
+
+from typing import Dict, List, Set, Tuple
+
+
+class ColumnTracker:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._dirty: Dict[Tuple[str, int, int], Set[Tuple[int, int]]] = {}
+
+    def __len__(self) -> int:
+        with self.lock:
+            return sum(len(columns) for columns in self._dirty.values())
+
+    def markDirty(self, dimension: str, x: int, z: int) -> None:
+        with self.lock:
+            self._dirty.setdefault((dimension, x // 16, z // 16), set()).add((x % 16, z % 16))
+
+    def restore(self, chunkKey: Tuple[str, int, int], columns: Set[Tuple[int, int]]) -> None:
+        with self.lock:
+            self._dirty.setdefault(chunkKey, set()).update(columns)
+
+    def drain(self) -> List[Tuple[Tuple[str, int, int], Set[Tuple[int, int]], Set[Tuple[int, int]], Set[Tuple[int, int]]]]:
+        with self.lock:
+            dirty = self._dirty
+            self._dirty = {}
+
+        # Changing a column's height changes the shading of its neighbours, and
+        # shading those neighbours needs their own neighbours' heights.
+        return [
+            (chunkKey, columns, self._dilate(columns, 1), self._dilate(columns, 2))
+            for chunkKey, columns in dirty.items()
+        ]
+
+    def _dilate(self, columns: Set[Tuple[int, int]], radius: int) -> Set[Tuple[int, int]]:
+        dilated = set()
+
+        for x, z in columns:
+            for dx in range(-radius, radius + 1):
+                for dz in range(-radius, radius + 1):
+                    if 0 <= x + dx < 16 and 0 <= z + dz < 16:
+                        dilated.add((x + dx, z + dz))
+
+        return dilated
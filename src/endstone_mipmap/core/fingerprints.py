@@ -0,0 +1,37 @@
+import sqlite3
+
+from pathlib import Path
+from typing import Optional, Tuple
+
+
+class FingerprintStore:
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._connection = sqlite3.connect(path)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS fingerprints ("
+            "dimension TEXT NOT NULL, chunkX INTEGER NOT NULL, chunkZ INTEGER NOT NULL, "
+            "fingerprint TEXT NOT NULL, PRIMARY KEY (dimension, chunkX, chunkZ))"
+        )
+        self._connection.commit()
+
+    def get(self, key: Tuple[str, int, int]) -> Optional[str]:
+        row = self._connection.execute(
+            "SELECT fingerprint FROM fingerprints WHERE dimension = ? AND chunkX = ? AND chunkZ = ?", key
+        ).fetchone()
+
+        return row[0] if row else None
+
+    def put(self, key: Tuple[str, int, int], fingerprint: str) -> None:
+        self._connection.execute(
+            "INSERT OR REPLACE INTO fingerprints (dimension, chunkX, chunkZ, fingerprint) VALUES (?, ?, ?, ?)",
+            (*key, fingerprint)
+        )
+
+    def commit(self) -> None:
+        self._connection.commit()
+
+    def close(self) -> None:
+        self._connection.commit()
+        self._connection.close()
@@ -1,32 +1,145 @@
+import time
+import queue
 import asyncio
 import aiohttp
 
 import multiprocessing as mp
 
+from typing import Dict, List, Optional
+
 
 class PlayersSender:
     def __init__(self, config: dict):
         self.timeout = 5
         self.url = config.get("api").get("players")
-        
-    async def _sendPlayerData(self, session: aiohttp.ClientSession, data: dict) -> None:
+        self.skinsUrl = config.get("api").get("playerSkins", f"{self.url}/skins")
+
+        updateConfig: dict = config.get("playerUpdates", {})
+        self.minInterval = updateConfig.get("minSendInterval", 1.0)
+        self.maxInterval = updateConfig.get("maxSendInterval", 10.0)
+        self.interval = self.minInterval
+
+        self._skins: Dict[str, dict] = {}
+
+        self._pending: Dict[str, dict] = {}
+        self._quit = set()
+        self._keyframe = False
+        self._nextSend = 0.0
+
+    def _merge(self, players: List[dict], quit: List[str], keyframe: bool) -> None:
+        if keyframe:
+            self._pending = {}
+            self._quit = set()
+            self._keyframe = True
+
+        for name in quit:
+            self._pending.pop(name, None)
+            self._quit.add(name)
+
+        for player in players:
+            self._pending[player["name"]] = player
+            self._quit.discard(player["name"])
+
+    def _takePending(self) -> Optional[dict]:
+        if not (self._pending or self._quit or self._keyframe):
+            return None
+
+        playerData = {"keyframe": self._keyframe, "players": list(self._pending.values()), "quit": list(self._quit)}
+
+        self._pending = {}
+        self._quit = set()
+        self._keyframe = False
+
+        return playerData
+
+    def _restorePending(self, playerData: dict) -> None:
+        # Newer samples win over the ones that failed to send.
+        newer = self._takePending()
+        self._merge(playerData["players"], playerData["quit"], playerData["keyframe"])
+
+        if newer is not None:
+            self._merge(newer["players"], newer["quit"], newer["keyframe"])
+
+    def _backOff(self, retryAfter: Optional[float] = None) -> None:
+        self.interval = min(self.maxInterval, max(self.interval * 2, retryAfter or 0))
+
+    def _recover(self) -> None:
+        self.interval = max(self.minInterval, self.interval / 2)
+
+    async def _sendPlayerData(self, session: aiohttp.ClientSession, playerData: dict) -> None:
         try:
-            async with session.post(self.url, json=data, timeout=self.timeout) as response:
+            async with session.post(self.url, json=playerData, timeout=self.timeout) as response:
+                if response.status in (429, 503):
+                    retryAfter = response.headers.get("Retry-After")
+                    self._backOff(float(retryAfter) if retryAfter and retryAfter.isdigit() else None)
+                    self._restorePending(playerData)
+                    return
+
                 if response.status != 200:
                     errorText = await response.text()
                     print(f"[Mipmap] HTTP error {response.status} for players data: {errorText}")
-                
+                    self._backOff()
+                    return
+
+                missingSkins = (await response.json()).get("missingSkins", [])
+                self._recover()
+
+            if missingSkins:
+                await self._sendSkins(session, missingSkins)
+
         except aiohttp.ClientError as e:
             print(f"[Mipmap] Network error sending players data: {e}")
-        
+            self._backOff()
+            self._restorePending(playerData)
+
         except asyncio.TimeoutError as e:
             print(f"[Mipmap] Timeout sending players data: {e}")
-            
-    async def run(self, queue: mp.Queue) -> None:
+            self._backOff()
+            self._restorePending(playerData)
+
+    async def _sendSkins(self, session: aiohttp.ClientSession, skinHashes: List[str]) -> None:
+        skins = [{"hash": skinHash, **self._skins[skinHash]} for skinHash in skinHashes if skinHash in self._skins]
+        if not skins:
+            return
+
+        async with session.post(self.skinsUrl, json={"skins": skins}, timeout=self.timeout) as response:
+            if response.status != 200:
+                errorText = await response.text()
+                print(f"[Mipmap] HTTP error {response.status} for player skins: {errorText}")
+
+    def _trackSkins(self, playerData: dict) -> None:
+        self._skins.update(playerData.pop("skins", {}))
+
+        # Keyframes list every online player, so only their skins can be requested again.
+        if playerData.get("keyframe"):
+            onlineSkins = {player.get("skinHash") for player in playerData.get("players", [])}
+            self._skins = {skinHash: skin for skinHash, skin in self._skins.items() if skinHash in onlineSkins}
+
+    def _drain(self, playersQueue: mp.Queue) -> None:
+        while True:
+            try:
+                playerData = playersQueue.get_nowait()
+
+            except queue.Empty:
+                return
+
+            self._trackSkins(playerData)
+            self._merge(playerData.get("players", []), playerData.get("quit", []), playerData.get("keyframe", True))
+
+    async def run(self, playersQueue: mp.Queue) -> None:
         async with aiohttp.ClientSession() as session:
             while True:
-                if not queue.empty():
-                    playerData = queue.get()
-                    asyncio.create_task(self._sendPlayerData(session, playerData))
-                else:
+                self._drain(playersQueue)
+
+                if time.monotonic() < self._nextSend:
+                    await asyncio.sleep(0.1)
+                    continue
+
+                playerData = self._takePending()
+                if playerData is None:
                     await asyncio.sleep(0.1)
+                    continue
+
+                # One update in flight at a time; later samples are merged while it runs.
+                await self._sendPlayerData(session, playerData)
+                self._nextSend = time.monotonic() + self.interval
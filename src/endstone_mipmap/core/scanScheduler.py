@@ -0,0 +1,78 @@
+import time
+
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+
+class ScanScheduler:
+    def __init__(self, scan: Callable[[Hashable, bool], None], budgetMs: float, backoffTickUsage: float, maxSkippedTicks: int):
+        self.scan = scan
+        self.budget = budgetMs / 1000
+        self.backoffTickUsage = backoffTickUsage
+        self.maxSkippedTicks = maxSkippedTicks
+
+        self._scans = OrderedDict()
+        self._pinnedScans = OrderedDict()
+        self._skippedTicks = 0
+
+        self.scansLastTick = 0
+        self.msLastTick = 0.0
+        self.totalScans = 0
+        self.totalMs = 0.0
+        self.backoffTicks = 0
+
+    def __len__(self) -> int:
+        return len(self._scans) + len(self._pinnedScans)
+
+    def schedule(self, key: Hashable, pinned: bool = False) -> None:
+        if key in self._pinnedScans:
+            return
+
+        if pinned:
+            self._scans.pop(key, None)
+            self._pinnedScans[key] = True
+        else:
+            self._scans[key] = True
+
+    def cancel(self, key: Hashable) -> None:
+        self._scans.pop(key, None)
+        self._pinnedScans.pop(key, None)
+
+    def runTick(self, tickUsage: float) -> int:
+        self.scansLastTick = 0
+        self.msLastTick = 0.0
+
+        if not len(self):
+            self._skippedTicks = 0
+            return 0
+
+        budget = self.budget
+        if tickUsage >= self.backoffTickUsage:
+            self.backoffTicks += 1
+
+            # Under sustained load keep trickling one scan through so /loadmap
+            # batches never stall completely.
+            if self._skippedTicks < self.maxSkippedTicks:
+                self._skippedTicks += 1
+                return 0
+
+            budget = 0
+
+        self._skippedTicks = 0
+        start = time.perf_counter()
+
+        while len(self):
+            pending = self._pinnedScans if self._pinnedScans else self._scans
+            key, _ = pending.popitem(last=False)
+
+            self.scan(key, pending is self._pinnedScans)
+            self.scansLastTick += 1
+
+            if time.perf_counter() - start >= budget:
+                break
+
+        self.msLastTick = (time.perf_counter() - start) * 1000
+        self.totalScans += self.scansLastTick
+        self.totalMs += self.msLastTick
+
+        return self.scansLastTick
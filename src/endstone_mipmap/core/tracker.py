@@ -1,3 +1,4 @@
+import time
 import threading
 
 from typing import Callable, Optional, Set, Tuple
@@ -15,15 +16,25 @@ class BatchTracker:
         self.processedChunks: Set[Tuple[int, int]] = set()
         
         self.onBatchComplete: Optional[Callable] = None
+        self.onBatchStalled: Optional[Callable] = None
+
+        mapLoading: dict = plugin.config.get("mapLoading", {})
+        self.progressTimeout = mapLoading.get("progressTimeoutSeconds", 60)
+        self.maxRetries = mapLoading.get("maxRetries", 3)
+        self.lastProgress = 0.0
+        self.retries = 0
         
         self.timeoutTask = None
         
-    def startBatch(self, batchId: int, areas: list, onComplete: Callable) -> None:
+    def startBatch(self, batchId: int, areas: list, onComplete: Callable, onStalled: Optional[Callable] = None) -> None:
         with self.lock:
             self.batchId = batchId
             self.expectedChunks.clear()
             self.processedChunks.clear()
             self.onBatchComplete = onComplete
+            self.onBatchStalled = onStalled
+            self.lastProgress = time.monotonic()
+            self.retries = 0
             
             for minX, minZ, maxX, maxZ, _ in areas:
                 chunkMinX = minX // 16
@@ -37,14 +48,13 @@ class BatchTracker:
             
             self.plugin.logger.info(f"Batch {batchId} started. Expected chunks: {len(self.expectedChunks)}")
             
-            if self.timeoutTask:
-                try:
-                    self.plugin.server.scheduler.cancel_task(self.timeoutTask)   
-                except:
-                    pass
-
-                self.timeoutTask = None
+            self._cancelTimeout()
+            self.timeoutTask = self.plugin.server.scheduler.run_task(self.plugin, self._checkProgress, delay=20, period=20)
     
+    def isExpected(self, chunkX: int, chunkZ: int) -> bool:
+        with self.lock:
+            return self.batchId is not None and (chunkX, chunkZ) in self.expectedChunks
+
     def chunkProcessed(self, chunkX: int, chunkZ: int) -> None:
         with self.lock:
             if self.batchId is None:
@@ -54,6 +64,8 @@ class BatchTracker:
             
             if chunkCoords in self.expectedChunks:
                 self.processedChunks.add(chunkCoords)
+                self.lastProgress = time.monotonic()
+                self.retries = 0
                 
                 progress = len(self.processedChunks)
                 total = len(self.expectedChunks)
@@ -71,7 +83,43 @@ class BatchTracker:
             else:
                 self.plugin.logger.debug(f"Received chunk ({chunkX}, {chunkZ}) not in current batch {self.batchId}")
     
-    def _completeBatch(self) -> None:
+    def _checkProgress(self) -> None:
+        with self.lock:
+            if self.batchId is None or time.monotonic() - self.lastProgress < self.progressTimeout:
+                return
+
+            missing = self.expectedChunks - self.processedChunks
+
+            if self.retries >= self.maxRetries:
+                self.plugin.logger.warning(
+                    f"Batch {self.batchId} made no progress after {self.retries} retries, "
+                    f"giving up on {len(missing)} chunks"
+                )
+                self._completeBatch(rendered=False)
+                return
+
+            self.retries += 1
+            self.lastProgress = time.monotonic()
+            onStalled = self.onBatchStalled
+
+            self.plugin.logger.warning(
+                f"Batch {self.batchId} made no progress for {self.progressTimeout}s, "
+                f"requesting {len(missing)} chunks again (retry {self.retries}/{self.maxRetries})"
+            )
+
+        if onStalled:
+            onStalled(missing)
+
+    def _cancelTimeout(self) -> None:
+        if self.timeoutTask:
+            try:
+                self.timeoutTask.cancel()
+            except:
+                pass
+
+            self.timeoutTask = None
+
+    def _completeBatch(self, rendered: bool = True) -> None:
         if self.batchId is None:
             return
         
@@ -80,13 +128,7 @@ class BatchTracker:
             f"Processed {len(self.processedChunks)}/{len(self.expectedChunks)} chunks"
         )
         
-        if self.timeoutTask:
-            try:
-                self.plugin.server.scheduler.cancel_task(self.timeoutTask)
-            except:
-                pass
-
-            self.timeoutTask = None
+        self._cancelTimeout()
         
         callback = self.onBatchComplete
         self.batchId = None
@@ -95,23 +137,19 @@ class BatchTracker:
         self.processedChunks.clear()
 
         self.onBatchComplete = None
+        self.onBatchStalled = None
         
         if callback:
-            self.plugin.server.scheduler.run_task(self.plugin, callback, 1)
+            self.plugin.server.scheduler.run_task(self.plugin, lambda: callback(rendered), 1)
     
     
     def cancelBatch(self) -> None:
         with self.lock:
-            if self.timeoutTask:
-                try:
-                    self.plugin.server.scheduler.cancel_task(self.timeoutTask)
-                except:
-                    pass
-                
-                self.timeoutTask = None
+            self._cancelTimeout()
             
             self.batchId = None
             self.onBatchComplete = None
+            self.onBatchStalled = None
 
             self.expectedChunks.clear()
             self.processedChunks.clear()
@@ -1,17 +1,26 @@
+import time
+import queue
 import asyncio
+import hashlib
 import multiprocessing as mp
 
+from pathlib import Path
+
 from endstone.plugin import Plugin
-from endstone.block import BlockFace
-from endstone.event import event_handler, ChunkLoadEvent, PlayerJoinEvent, PlayerQuitEvent
+from endstone.block import Block, BlockFace
+from endstone.level import Dimension
+from endstone.event import (
+    event_handler, ChunkLoadEvent, ChunkUnloadEvent, PlayerJoinEvent, PlayerQuitEvent,
+    BlockBreakEvent, BlockPlaceEvent, LeavesDecayEvent, ActorExplodeEvent
+)
 
 from .commands.loadmap import LoadmapCommand
-from .core import ChunksSender, PlayersSender, BatchTracker
+from .core import ChunkQueue, ChunksSender, PlayersSender, BatchTracker, ColumnTracker, ScanScheduler
 
 
-def startChunkSender(queue: mp.Queue, resultQueue: mp.Queue, config: dict) -> None:
+def startChunkSender(queue: mp.Queue, resultQueue: mp.Queue, config: dict, fingerprintsPath: Path) -> None:
     try:
-        sender = ChunksSender(config, resultQueue)
+        sender = ChunksSender(config, resultQueue, fingerprintsPath)
         asyncio.run(sender.run(queue))
     except KeyboardInterrupt:
         return
@@ -34,6 +43,7 @@ class Map(Plugin):
             "usages": [
                 "/loadmap",
                 "/loadmap <minX: int> <minZ: int> <maxX: int> <maxZ: int>",
+                "/loadmap resume",
                 "/loadmap status",
                 "/loadmap help"
             ],
@@ -71,17 +81,40 @@ class Map(Plugin):
 
         self.batchTracker = BatchTracker(self)
 
-        self._chunksQueue = mp.Queue()
+        senderConfig: dict = self.config.get("chunksSender", {})
+
+        self._chunksQueue = mp.Queue(maxsize=senderConfig.get("handoffSize", 64))
+        self._pendingChunks = ChunkQueue(self._chunksQueue, senderConfig.get("queueLimit", 4096))
         self._resultQueue = mp.Queue()
+        self.renderQueue = (0, 0)
         self._playersQueue = mp.Queue()
+        self._playerSkins = {}
+        self._playerUpdates: dict = self.config.get("playerUpdates", {})
+        self._sentPlayers = {}
+        self._lastKeyframe = 0.0
+
+        scanConfig: dict = self.config.get("chunkScanning", {})
+        self.scanScheduler = ScanScheduler(
+            self._scanChunk,
+            scanConfig.get("budgetMs", 5),
+            scanConfig.get("backoffTickUsage", 0.8),
+            scanConfig.get("maxSkippedTicks", 20)
+        )
+        self._blacklist = frozenset(self.config.get("blacklist", {}).get("blocks", []))
+        self._chunkLoadedAt = {}
+
+        self._columnConfig: dict = self.config.get("columnUpdates", {})
+        self._dirtyColumns = ColumnTracker()
+        self._columnFlushTask = None
         
         self._chunkDataSenderProcess = mp.Process(
             target=startChunkSender, 
-            args=(self._chunksQueue, self._resultQueue, self.config)
+            args=(self._chunksQueue, self._resultQueue, self.config, Path(self.data_folder) / "fingerprints.db")
         )
         self._chunkDataSenderProcess.start()
         
         self._scheduleResultProcessing()
+        self.server.scheduler.run_task(self, self._runScans, delay=1, period=1)
         
         self._playerDataSenderProcess = mp.Process(
             target=startPlayersSender,
@@ -89,7 +122,7 @@ class Map(Plugin):
         )
         self._playerDataSenderProcess.start()
         
-        self._schedulePlayersUpdate()
+        self.server.scheduler.run_task(self, self._samplePlayers, delay=20, period=self._playerUpdates.get("samplePeriodTicks", 20))
 
     def on_disable(self) -> None:
         if hasattr(self, '_chunkDataSenderProcess'):
@@ -102,98 +135,231 @@ class Map(Plugin):
 
     @event_handler
     def loadChunk(self, event: ChunkLoadEvent):
-        chunkData = self._getСhunkData(event)
-        
-        chunkData["chunkX"] = event.chunk.x
-        chunkData["chunkZ"] = event.chunk.z
-        
-        self._chunksQueue.put(chunkData)
+        chunkKey = (event.chunk.dimension.name, event.chunk.x, event.chunk.z)
+        self._chunkLoadedAt.setdefault(chunkKey, time.time())
+        self.scanScheduler.schedule(chunkKey, pinned=self.batchTracker.isExpected(event.chunk.x, event.chunk.z))
+
+    @event_handler
+    def unloadChunk(self, event: ChunkUnloadEvent):
+        chunkKey = (event.chunk.dimension.name, event.chunk.x, event.chunk.z)
+        self._chunkLoadedAt.pop(chunkKey, None)
+        self.scanScheduler.cancel(chunkKey)
+    
+    @event_handler
+    def onBlockBreak(self, event: BlockBreakEvent):
+        self._markColumn(event.block)
+
+    @event_handler
+    def onBlockPlace(self, event: BlockPlaceEvent):
+        self._markColumn(event.block)
+
+    @event_handler
+    def onLeavesDecay(self, event: LeavesDecayEvent):
+        self._markColumn(event.block)
+
+    @event_handler
+    def onActorExplode(self, event: ActorExplodeEvent):
+        for block in event.block_list:
+            self._markColumn(block)
     
     @event_handler
     def onPlayerJoin(self, event: PlayerJoinEvent):
-        self._sendPlayers()
+        self._samplePlayers()
     
     @event_handler
     def onPlayerQuit(self, event: PlayerQuitEvent):
-        self._sendPlayers()
+        self._samplePlayers(leaving=event.player.name)
+
+    def _markColumn(self, block: Block) -> None:
+        if not self._columnConfig.get("enabled", True):
+            return
+
+        self._dirtyColumns.markDirty(block.dimension.name, block.x, block.z)
+        self._scheduleColumnFlush()
+
+    def _scheduleColumnFlush(self) -> None:
+        if self._columnFlushTask is None:
+            debounceTicks = self._columnConfig.get("debounceTicks", 40)
+            self._columnFlushTask = self.server.scheduler.run_task(self, self._flushColumns, delay=debounceTicks)
+
+    def _flushColumns(self) -> None:
+        self._columnFlushTask = None
+
+        for chunkKey, dirtyColumns, renderColumns, contextColumns in self._dirtyColumns.drain():
+            dimensionName, chunkX, chunkZ = chunkKey
+            dimension = self.server.level.get_dimension(dimensionName)
+
+            columns = []
+            for x, z in contextColumns:
+                block = self._getSurfaceBlock(dimension, chunkX * 16 + x, chunkZ * 16 + z)
+                columns.append({
+                    "x": x,
+                    "z": z,
+                    "name": block.data.type,
+                    "height": block.y,
+                    "context": (x, z) not in renderColumns
+                })
+
+            columnsData = {
+                "chunkX": chunkX,
+                "chunkZ": chunkZ,
+                "columns": {
+                    "dimension": dimensionName,
+                    "chunkX": chunkX,
+                    "chunkZ": chunkZ,
+                    "columns": columns
+                }
+            }
+
+            try:
+                self._chunksQueue.put_nowait(columnsData)
+            except queue.Full:
+                self._dirtyColumns.restore(chunkKey, dirtyColumns)
+                self._scheduleColumnFlush()
+
+    def _runScans(self) -> None:
+        self.scanScheduler.runTick(self.server.current_tick_usage)
+        self._pendingChunks.pump()
+
+    def _scanChunk(self, chunkKey: tuple, pinned: bool) -> None:
+        dimensionName, chunkX, chunkZ = chunkKey
+
+        chunkData = {
+            "chunkX": chunkX,
+            "chunkZ": chunkZ,
+            "chunk": self._getСhunkData(self.server.level.get_dimension(dimensionName), chunkX, chunkZ),
+            "pinned": pinned
+        }
+
+        # Timestamps for the freshness trace; the web server adds the later stages.
+        loadedAt = self._chunkLoadedAt.pop(chunkKey, None)
+        if loadedAt is not None:
+            chunkData["trace"] = [loadedAt, time.time()]
+
+        self._pendingChunks.push(chunkKey, chunkData, pinned=pinned)
 
     def _scheduleResultProcessing(self) -> None:
         self.server.scheduler.run_task(self, self._processResults, 1)
     
     def _processResults(self) -> None:
+        self._pendingChunks.pump()
+
         while not self._resultQueue.empty():
             try:
                 result = self._resultQueue.get_nowait()
                 status, chunkX, chunkZ = result
                 
-                if status == "success":
+                if status == "rendered":
                     self.batchTracker.chunkProcessed(chunkX, chunkZ)
+                elif status == "queue":
+                    self.renderQueue = (chunkX, chunkZ)
                     
             except:
                 break
         
         self._scheduleResultProcessing()
     
-    def _schedulePlayersUpdate(self) -> None:
-        self.server.scheduler.run_task(self, self._sendPlayers, delay=100)
-    
-    def _sendPlayers(self) -> None:
+    def _hasChanged(self, player: dict) -> bool:
+        sent = self._sentPlayers.get(player["name"])
+        if sent is None or sent["dimension"] != player["dimension"] or sent["skinHash"] != player["skinHash"]:
+            return True
+
+        threshold = self._playerUpdates.get("moveThreshold", 0.5)
+        return (sent["x"] - player["x"]) ** 2 + (sent["y"] - player["y"]) ** 2 + (sent["z"] - player["z"]) ** 2 >= threshold ** 2
+
+    def _samplePlayers(self, leaving: str = None) -> None:
         if not self.config.get("sendPlayers"):
             return
         
         players = []
+        skins = {}
+        playerSkins = {}
         
         for player in self.server.online_players:
-            skin = player.skin.image
+            if player.name == leaving:
+                continue
+
+            skin = player.skin
+            skinId, skinHash = self._playerSkins.get(player.name, (None, None))
+
+            # Hashing needs the pixels, so only do it when the skin id changes.
+            if skinId != skin.id:
+                image = skin.image
+                skinBytes = image.tobytes()
+                skinId, skinHash = skin.id, hashlib.sha1(skinBytes).hexdigest()
+
+                skins[skinHash] = {
+                    "xuid": player.xuid,
+                    "skin": skinBytes.hex(),
+                    "skinShape": list(image.shape)
+                }
+
+            playerSkins[player.name] = (skinId, skinHash)
                         
             players.append({
                 "name": player.name,
                 "xuid": player.xuid,
-                "skin": skin.tobytes().hex(),
-                "skinShape": list(skin.shape),
+                "skinHash": skinHash,
                 "dimension": player.dimension.name,
                 "x": player.location.x,
                 "y": player.location.y,
                 "z": player.location.z
             })
         
-        playerData = {"players": players}
-        self._playersQueue.put(playerData)
-        
-        self._schedulePlayersUpdate()
+        self._playerSkins = playerSkins
+
+        now = time.monotonic()
+        keyframe = now - self._lastKeyframe >= self._playerUpdates.get("keyframeSeconds", 10)
+        quit = [name for name in self._sentPlayers if name not in playerSkins]
+        changed = [player for player in players if keyframe or self._hasChanged(player)]
+
+        for name in quit:
+            del self._sentPlayers[name]
+
+        for player in changed:
+            self._sentPlayers[player["name"]] = player
+
+        if keyframe:
+            self._lastKeyframe = now
 
-    def _getСhunkData(self, event: ChunkLoadEvent) -> dict:
-        world = event.chunk.dimension
-        chunkX = event.chunk.x
-        chunkZ = event.chunk.z
+        if changed or quit or keyframe:
+            self._playersQueue.put({"keyframe": keyframe, "players": changed, "quit": quit, "skins": skins})
 
+    def _getСhunkData(self, world: Dimension, chunkX: int, chunkZ: int) -> dict:
         chunkStartX = chunkX * 16
         chunkStartZ = chunkZ * 16
         chunkEndX = chunkStartX + 16
         chunkEndZ = chunkStartZ + 16
 
-        blocksData = []
-        blacklist: dict = self.config.get("blacklist")
+        palette = {}
+        indices = bytearray(256)
+        heights = [0] * 256
 
         for x in range(chunkStartX, chunkEndX):
             for z in range(chunkStartZ, chunkEndZ):                
-                block = world.get_highest_block_at(x, z)
-                blockType = block.data.type
+                block = self._getSurfaceBlock(world, x, z)
 
-                while blockType in blacklist.get("blocks") and block.y > -64:
-                    block = block.get_relative(BlockFace.DOWN, 1)
-                    blockType = block.data.type
-
-                blocksData.append({
-                    "name": blockType,
-                    "coordinates": [block.x, block.y, block.z]
-                })
+                i = (z - chunkStartZ) * 16 + (x - chunkStartX)
+                indices[i] = palette.setdefault(block.data.type, len(palette))
+                heights[i] = block.y
         
         chunkData = {
-            "chunk": {
-                "dimension": world.name,
-                "blocks": blocksData
-            }
+            "dimension": world.name,
+            "chunkX": chunkX,
+            "chunkZ": chunkZ,
+            "palette": list(palette),
+            "indices": bytes(indices),
+            "heights": heights
         }
 
-        return chunkData
\ No newline at end of file
+        return chunkData
+
+    def _getSurfaceBlock(self, world: Dimension, x: int, z: int) -> Block:
+        block = world.get_highest_block_at(x, z)
+        blockType = block.data.type
+
+        while blockType in self._blacklist and block.y > -64:
+            block = block.get_relative(BlockFace.DOWN, 1)
+            blockType = block.data.type
+
+        return block
\ No newline at end of file
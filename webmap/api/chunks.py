@@ -1,7 +1,19 @@
-from fastapi import APIRouter, HTTPException
+import json
+import time
+import base64
+import asyncio
 
-from models.chunk import ChunkRequest
+from typing import Optional, Union
+
+from fastapi import APIRouter, HTTPException, Request
+
+from models.chunk import ChunkRequest, ChunkData, CompactChunkData, ColumnUpdate, splitChunkBatch
 from services.tileService import TileQueueManager
+from services.fingerprintStore import FingerprintStore
+from services.renderLog import RenderLog
+from services.chunkManifest import ChunkManifest, REGION_SIZE
+from services.freshness import FreshnessTracker, parseTraces, traceQueue
+from core.config import SKIP_UNCHANGED_CHUNKS, RENDER_QUEUE_LIMIT
 from core.logging import getLogger
 
 
@@ -10,23 +22,197 @@ router = APIRouter(prefix="/api", tags=["chunks"])
 
 
 tileManager = TileQueueManager()
+fingerprintStore = FingerprintStore()
+renderLog = RenderLog()
+chunkManifest = ChunkManifest()
+freshness = FreshnessTracker()
+
+
+def enqueueChunk(chunk: Union[ChunkData, CompactChunkData], trace: Optional[list] = None) -> bool:
+    if not SKIP_UNCHANGED_CHUNKS:
+        tileManager.addTask(chunk, trace)
+        return True
+
+    chunkKey = chunk.chunkKey
+    fingerprint = chunk.fingerprint()
+
+    if fingerprintStore.isUnchanged(chunkKey, fingerprint):
+        return False
+
+    # The fingerprint is saved when the worker reports the chunk's tiles written.
+    tileManager.addTask(chunk, trace, fingerprint)
+
+    return True
+
+
+async def markUnchanged(chunkKeys: list) -> None:
+    # Unchanged chunks are on the map already; they only need to be in the manifest.
+    if chunkKeys:
+        await asyncio.to_thread(chunkManifest.markChunks, chunkKeys)
+
+
+def chunkResponse(queued: bool) -> dict:
+    queueSize = tileManager.queueSize()
+
+    message = (
+        "The data has been successfully received and added to the processing queue."
+        if queued else "The chunk is unchanged and was not queued."
+    )
+
+    return {
+        "status": "success",
+        "message": message,
+        "unchanged": not queued,
+        "queueSize": queueSize
+    }
 
 
 @router.post("/chunks-data")
 async def receiveChunkData(chunkData: ChunkRequest):
     try:    
-        queueSize = tileManager.addTask(chunkData.chunk)
-        logger.info(f"Task added to queue. Queue size: {queueSize}")
+        queued = enqueueChunk(chunkData.chunk)
+        if not queued:
+            await markUnchanged([chunkData.chunk.chunkKey])
+
+        return chunkResponse(queued)
+    
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Data processing error: {str(e)}")
+
+
+@router.post("/chunks-data/binary")
+async def receiveBinaryChunkData(request: Request):
+    try:
+        chunk = CompactChunkData.fromBytes(await request.body())
+        queued = enqueueChunk(chunk)
+        if not queued:
+            await markUnchanged([chunk.chunkKey])
+
+        return chunkResponse(queued)
+
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Data processing error: {str(e)}")
+
+
+@router.post("/chunks-data/batch")
+async def receiveChunkBatch(request: Request):
+    receivedAt = time.time()
+    body = await request.body()
+
+    try:
+        if request.headers.get("content-type", "").startswith("application/json"):
+            items = json.loads(body)["chunks"]
+            parseChunk = ChunkData.model_validate
+        else:
+            items = splitChunkBatch(body)
+            parseChunk = CompactChunkData.fromBytes
+
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Data processing error: {str(e)}")
+
+    results = []
+    unchanged = []
+    traces = parseTraces(request.headers.get("x-mipmap-trace"), len(items), receivedAt)
+
+    for item, trace in zip(items, traces):
+        try:
+            chunk = parseChunk(item)
+            queued = enqueueChunk(chunk, trace)
+            results.append({"status": "success", "unchanged": not queued})
+
+            if not queued:
+                unchanged.append(chunk.chunkKey)
+
+        except Exception as e:
+            results.append({"status": "error", "detail": f"Data processing error: {str(e)}"})
+
+    await markUnchanged(unchanged)
+    queueSize = tileManager.queueSize()
+    logger.debug(f"Batch of {len(results)} tasks received. Queue size: {queueSize}")
+
+    return {
+        "status": "success",
+        "message": "The batch has been received and its chunks added to the processing queue.",
+        "results": results,
+        "queueSize": queueSize
+    }
+
+
+@router.post("/chunks-data/columns")
+async def receiveColumnUpdate(update: ColumnUpdate):
+    try:
+        tileManager.addTask(update)
 
         return {
-            "status": "success", 
-            "message": "The data has been successfully received and added to the processing queue.",
-            "queueSize": queueSize
+            "status": "success",
+            "message": "The column update has been added to the processing queue.",
+            "queueSize": tileManager.queueSize()
         }
-    
+
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Data processing error: {str(e)}")
 
 
+@router.get("/chunks-data/rendered")
+async def getRenderedChunks(after: int = -1, timeout: float = 25):
+    # A cursor from before a restart, or none at all, starts from the current position.
+    if after < 0 or after > renderLog.cursor:
+        cursor, chunks = renderLog.cursor, []
+    else:
+        cursor, chunks = await renderLog.wait(after, min(timeout, 60))
+
+    return {
+        "status": "success",
+        "cursor": cursor,
+        "chunks": chunks,
+        "queueSize": tileManager.queueSize(),
+        "maxQueueSize": RENDER_QUEUE_LIMIT
+    }
+
+
+@router.get("/chunks-data/manifest")
+async def getChunkManifest(dimension: str, minX: int, minZ: int, maxX: int, maxZ: int):
+    regions = await asyncio.to_thread(chunkManifest.regions, dimension, minX, minZ, maxX, maxZ)
+
+    return {
+        "status": "success",
+        "regionSize": REGION_SIZE,
+        "regions": [
+            {"x": regionX, "z": regionZ, "bitmap": base64.b64encode(bitmap).decode("ascii")}
+            for (regionX, regionZ), bitmap in regions.items()
+        ]
+    }
+
+
+@router.get("/chunks-data/freshness")
+async def getChunkFreshness():
+    freshness.collect(traceQueue)
+
+    return {
+        "status": "success",
+        "window": freshness.window,
+        "awaitingZoom": freshness.pending,
+        "stages": freshness.summary()
+    }
+
+
+def saveRendered(rendered: list) -> None:
+    chunkManifest.markChunks([chunkKey for chunkKey, _ in rendered])
+    fingerprintStore.updateMany(rendered)
+
+
+async def collectRendered():
+    while True:
+        rendered = tileManager.takeRendered()
+        if rendered:
+            renderLog.append(chunkKey for chunkKey, _ in rendered)
+            await asyncio.to_thread(saveRendered, rendered)
+
+        freshness.collect(traceQueue)
+        tileManager.restartDeadWorkers()
+
+        await asyncio.sleep(0.1)
+
+
 def getTileManager() -> TileQueueManager:
     return tileManager
@@ -1,6 +1,6 @@
 from fastapi import APIRouter
 
-from core.config import MAP_SIZE, MAP_UPDATE_INTERVAL, MAP_DEFAULT_WORLD
+from core.config import MAP_SIZE, MAP_UPDATE_INTERVAL, MAP_DEFAULT_WORLD, RENDER_MODE, OVERVIEW_MAX_ZOOM
 
 
 router = APIRouter(prefix="/api", tags=["config"])
@@ -12,4 +12,5 @@ async def getConfig():
         "mapSize": MAP_SIZE,
         "updateInterval": MAP_UPDATE_INTERVAL,
         "defaultWorld": MAP_DEFAULT_WORLD,
+        "maxNativeZoom": OVERVIEW_MAX_ZOOM if RENDER_MODE == "overview" else 4,
     }
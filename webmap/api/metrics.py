@@ -0,0 +1,27 @@
+import asyncio
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from services.metrics import metrics, metricsQueue
+from api.chunks import getTileManager
+
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics")
+async def getMetrics():
+    metrics.collect(metricsQueue)
+
+    for worker, depth in enumerate(getTileManager().queueSizes()):
+        metrics.set("mipmap_render_queue_depth", depth, worker=worker)
+
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+async def collectMetrics():
+    # Keeps the queue short between scrapes, or when nothing scrapes at all.
+    while True:
+        metrics.collect(metricsQueue)
+        await asyncio.sleep(1)
@@ -1,8 +1,14 @@
-from fastapi import APIRouter, HTTPException, Response
-from pathlib import Path
+import json
+import time
+import asyncio
 
-from models.player import PlayersRequest
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from models.player import PlayersRequest, PlayerSkinsRequest
 from services.playerService import PlayerManager
+from services.metrics import metrics
+from core.config import PLAYER_STREAM_KEEPALIVE, PLAYER_STREAM_MAX_AGE
 from core.logging import getLogger
 
 
@@ -15,8 +21,23 @@ playerManager = PlayerManager()
 
 @router.post("/players-data")
 async def receivePlayersData(playersData: PlayersRequest):
-    await playerManager.updatePlayers(playersData)
-    return {"status": "success", "message": "Players data received successfully"}
+    if playerManager.isBusy:
+        metrics.inc("mipmap_player_updates_total", result="rejected")
+        return JSONResponse(
+            status_code=429,
+            content={"status": "error", "message": "Player updates are arriving faster than they are processed"},
+            headers={"Retry-After": "1"}
+        )
+
+    missingSkins = await playerManager.updatePlayers(playersData)
+    metrics.inc("mipmap_player_updates_total", result="applied")
+    return {"status": "success", "message": "Players data received successfully", "missingSkins": missingSkins}
+
+
+@router.post("/players-data/skins")
+async def receivePlayerSkins(skinsData: PlayerSkinsRequest):
+    stored = await playerManager.storeSkins(skinsData)
+    return {"status": "success", "stored": stored}
 
 
 @router.get("/players")
@@ -24,14 +45,50 @@ async def getPlayersData():
     return {"status": "success", "players": playerManager.players}
 
 
+def formatEvent(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+@router.get("/players/stream")
+async def streamPlayers(request: Request):
+    queue = playerManager.subscribe()
+
+    async def events():
+        # Streams end after a while and on shutdown; EventSource reconnects on its own.
+        closesAt = time.monotonic() + PLAYER_STREAM_MAX_AGE
+
+        try:
+            yield formatEvent("snapshot", playerManager.players)
+
+            while not await request.is_disconnected():
+                remaining = closesAt - time.monotonic()
+                if remaining <= 0:
+                    return
+
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), timeout=min(PLAYER_STREAM_KEEPALIVE, remaining))
+                    if event == "close":
+                        return
+
+                    yield formatEvent(event, data)
+
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+
+        finally:
+            playerManager.unsubscribe(queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.get("/players/{player_name}/skin.png")
 async def getPlayerSkin(player_name: str):
     try:
-        skinPath = Path("data/skins") / f"{player_name}.png"
-        if not skinPath.exists():
-            skinPath = Path("data/skins/default.png")
-        
-        with open(skinPath, "rb") as f:
+        with open(playerManager.facePath(player_name), "rb") as f:
             skinData = f.read()
         
         return Response(
@@ -1,23 +1,114 @@
-from fastapi import APIRouter, HTTPException, Response
+import time
 
-from core.config import TILE_CACHE_MAX_AGE, WORLDS_DIR
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional, Tuple
+
+from fastapi import APIRouter, HTTPException, Request, Response
+from starlette.concurrency import run_in_threadpool
+
+from core.config import TILE_CACHE_MAX_AGE, TILE_MEMORY_CACHE_MB, TILE_FORMAT, TILE_NEGOTIATE_WEBP
+from services.hotTileCache import HotTileCache
+from services.metrics import metrics
+from services.tileStore import createTileStore, tileMediaType, transcodeTile
 
 
 router = APIRouter(prefix="/api", tags=["tiles"])
 
+tileStore = createTileStore()
+hotTiles = HotTileCache(TILE_MEMORY_CACHE_MB * 1024 * 1024)
+
+MEDIA_TYPES = {"png": "image/png", "webp": "image/webp", "webp-lossless": "image/webp"}
+
+
+def negotiateFormat(request: Request) -> str:
+    acceptsWebp = "image/webp" in request.headers.get("accept", "")
+
+    if acceptsWebp and TILE_FORMAT.startswith("webp"):
+        return TILE_FORMAT
+    if acceptsWebp and TILE_NEGOTIATE_WEBP:
+        return "webp"
+
+    return "png"
+
+
+def readTile(tileKey: tuple, tileFormat: str) -> Optional[Tuple[bytes, int]]:
+    tile = tileStore.readVersioned(tileKey)
+    if tile is None:
+        return None
+
+    tileData, version = tile
+    if tileMediaType(tileData) != MEDIA_TYPES[tileFormat]:
+        tileData = transcodeTile(tileData, tileFormat)
+
+    return tileData, version
+
+
+def recordRequest(result: str, started: float) -> None:
+    metrics.inc("mipmap_tile_requests_total", result=result)
+    metrics.observe("mipmap_tile_request_seconds", time.perf_counter() - started)
+
+
+def isNotModified(request: Request, etag: str, version: int) -> bool:
+    ifNoneMatch = request.headers.get("if-none-match")
+    if ifNoneMatch is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in ifNoneMatch.split(",")]
+        return etag in tags or "*" in tags
+
+    ifModifiedSince = request.headers.get("if-modified-since")
+    if ifModifiedSince is not None:
+        try:
+            return version // 1_000_000 <= parsedate_to_datetime(ifModifiedSince).timestamp()
+        except (TypeError, ValueError):
+            return False
+
+    return False
+
 
 @router.get("/tiles/{dimension}/{z}/{x}/{y}")
-async def getTile(dimension: str, z: int, x: int, y: int):
-    try:
-        tilePath = WORLDS_DIR / dimension / "tiles" / f"zoom-{z}" / f"({x})-({y}).png"
-        with open(tilePath, "rb") as f:
-            tileData = f.read()
+async def getTile(request: Request, dimension: str, z: int, x: int, y: int):
+    started = time.perf_counter()
+    tileKey = (dimension, z, x, y)
+    tileFormat = negotiateFormat(request)
+    cacheKey = (tileKey, tileFormat)
 
-    except FileNotFoundError:
+    version = await run_in_threadpool(tileStore.version, tileKey)
+    if version is None:
+        for servedFormat in MEDIA_TYPES:
+            hotTiles.discard((tileKey, servedFormat))
+        recordRequest("not_found", started)
         raise HTTPException(status_code=404, detail="Tile not found")
-    
+
+    etag = f'"{version:x}-{tileFormat}"'
+    headers = {
+        "Cache-Control": f"public, max-age={TILE_CACHE_MAX_AGE}",
+        "ETag": etag,
+        "Last-Modified": formatdate(version / 1_000_000, usegmt=True),
+        "Vary": "Accept"
+    }
+
+    if isNotModified(request, etag, version):
+        recordRequest("not_modified", started)
+        return Response(status_code=304, headers=headers)
+
+    result = "hit"
+    tileData = hotTiles.get(cacheKey, version)
+    if tileData is None:
+        result = "miss"
+        tile = await run_in_threadpool(readTile, tileKey, tileFormat)
+        if tile is None:
+            recordRequest("not_found", started)
+            raise HTTPException(status_code=404, detail="Tile not found")
+
+        tileData, readVersion = tile
+        hotTiles.put(cacheKey, tileData, readVersion)
+
+        if readVersion != version:
+            headers["ETag"] = f'"{readVersion:x}-{tileFormat}"'
+            headers["Last-Modified"] = formatdate(readVersion / 1_000_000, usegmt=True)
+
+    recordRequest(result, started)
     return Response(
         content=tileData,
-        media_type="image/png",
-        headers={"Cache-Control": f"public, max-age={TILE_CACHE_MAX_AGE}"}
+        media_type=MEDIA_TYPES[tileFormat],
+        headers=headers
     )
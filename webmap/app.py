@@ -1,16 +1,19 @@
+import asyncio
+
 from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
 from contextlib import asynccontextmanager
 
-from core.config import STATIC_DIR, TEMPLATES_DIR
+from core.config import STATIC_DIR, TEMPLATES_DIR, RENDER_MODE
 from core.logging import setupLogging
 
 from api.tiles import router as tilesRouter
-from api.chunks import router as chunksRouter, getTileManager
-from api.players import router as playersRouter
+from api.chunks import router as chunksRouter, getTileManager, collectRendered
+from api.players import router as playersRouter, playerManager
 from api.config import router as configRouter
+from api.metrics import router as metricsRouter, collectMetrics
 
 from services.zoomGenerator import ZoomManager
 
@@ -19,14 +22,20 @@ from services.zoomGenerator import ZoomManager
 async def lifespan(app: FastAPI):
     tileManager = getTileManager()
     tileManager.startWorkers()
+    renderCollector = asyncio.create_task(collectRendered())
+    metricsCollector = asyncio.create_task(collectMetrics())
     
     zoomManager = ZoomManager()
-    zoomManager.start()
+    if RENDER_MODE == "textured":
+        zoomManager.start()
     
     yield
     
+    renderCollector.cancel()
+    metricsCollector.cancel()
     tileManager.stopWorkers()
     zoomManager.stop()
+    await playerManager.close()
 
 
 def createApp() -> FastAPI:
@@ -41,6 +50,7 @@ def createApp() -> FastAPI:
     app.include_router(chunksRouter)
     app.include_router(playersRouter)
     app.include_router(configRouter)
+    app.include_router(metricsRouter)
     
     @app.get("/")
     async def home(request: Request):
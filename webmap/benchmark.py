@@ -0,0 +1,357 @@
+import os
+import sys
+import json
+import time
+import shutil
+import struct
+import logging
+import argparse
+import platform
+import tempfile
+
+import numpy as np
+
+from pathlib import Path
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import core.config as config
+
+from core.logging import setupLogging, getLogger
+
+from models.chunk import BATCH_MAGIC, BATCH_FORMAT_VERSION, CompactChunkData
+
+
+logger = getLogger(__name__)
+
+BENCHMARK_FORMAT_VERSION = 1
+SEA_LEVEL = 63
+
+# Surface blocks that ship with a texture, grouped the way they show up together.
+BIOMES = {
+    "Overworld": [
+        ["grass_block", "dirt", "podzol", "moss_block", "oak_leaves"],
+        ["sand", "sandstone", "red_sand", "terracotta", "clay"],
+        ["stone", "gravel", "stone_andesite", "stone_granite", "stone_diorite"],
+        ["snow", "ice", "spruce_leaves", "stone", "gravel"],
+        ["grass_block", "birch_leaves", "oak_leaves", "dirt"],
+    ],
+    "Nether": [
+        ["netherrack", "gravel", "stone"],
+    ]
+}
+
+
+def syntheticChunk(dimension: str, chunkX: int, chunkZ: int, rng: np.random.Generator) -> CompactChunkData:
+    blockX, blockZ = np.meshgrid(chunkX * 16 + np.arange(16), chunkZ * 16 + np.arange(16))
+
+    # Smooth hills and valleys, so neighbouring chunks line up and some of them sit under water.
+    terrain = SEA_LEVEL + 4 + 28 * np.sin(blockX / 41.0) * np.cos(blockZ / 57.0) + 10 * np.sin((blockX + blockZ) / 19.0)
+    heights = np.rint(terrain + rng.normal(0, 1.5, (16, 16))).astype(np.int16)
+
+    biomes = BIOMES.get(dimension, BIOMES["Overworld"])
+    biome = biomes[(chunkX // 4 * 31 + chunkZ // 4 * 17) % len(biomes)]
+    palette = list(rng.choice(biome, size=rng.integers(1, len(biome) + 1), replace=False))
+
+    # Blocks follow height bands, with a few stray ones mixed in.
+    span = max(1, int(heights.max() - heights.min()) + 1)
+    indices = ((heights - heights.min()) * len(palette) // span).astype(np.uint8)
+    stray = rng.random((16, 16)) < 0.15
+    indices[stray] = rng.integers(0, len(palette), int(stray.sum()))
+
+    underwater = heights < SEA_LEVEL
+    if underwater.any() and dimension == "Overworld":
+        palette.append("water")
+        indices[underwater] = len(palette) - 1
+        heights[underwater] = SEA_LEVEL - 1
+
+    return CompactChunkData(dimension, chunkX, chunkZ, palette, indices, heights)
+
+
+def syntheticGrid(dimension: str, size: int, seed: int, originX: int = 0, originZ: int = 0) -> List[CompactChunkData]:
+    rng = np.random.default_rng(seed)
+    return [syntheticChunk(dimension, originX + x, originZ + z, rng) for z in range(size) for x in range(size)]
+
+
+def chunkJson(chunk: CompactChunkData) -> dict:
+    blocks = [
+        {"name": chunk.palette[chunk.indices[z, x]], "coordinates": [chunk.chunkX * 16 + x, int(chunk.heights[z, x]), chunk.chunkZ * 16 + z]}
+        for z in range(16) for x in range(16)
+    ]
+
+    return {"chunk": {"dimension": chunk.dimension, "blocks": blocks}}
+
+
+def chunkBatch(chunks: List[CompactChunkData]) -> bytes:
+    parts = [struct.pack("<4sBH", BATCH_MAGIC, BATCH_FORMAT_VERSION, len(chunks))]
+
+    for chunk in chunks:
+        frame = chunk.toBytes()
+        parts.append(struct.pack("<I", len(frame)))
+        parts.append(frame)
+
+    return b"".join(parts)
+
+
+def metric(value: float, unit: str, better: Optional[str]) -> dict:
+    return {"value": round(value, 4), "unit": unit, "better": better}
+
+
+def percentiles(prefix: str, timings: List[float]) -> Dict[str, dict]:
+    milliseconds = np.array(timings) * 1000
+
+    return {
+        f"{prefix}.p50Ms": metric(float(np.percentile(milliseconds, 50)), "ms", "lower"),
+        f"{prefix}.p95Ms": metric(float(np.percentile(milliseconds, 95)), "ms", "lower")
+    }
+
+
+def benchmarkRender(chunks: List[CompactChunkData]) -> Dict[str, dict]:
+    from services.tileCache import TileCache
+    from services.tileService import createRenderer
+    from services.tileStore import createTileStore
+
+    tileStore = createTileStore()
+    tileCache = TileCache(tileStore, config.RENDER_CACHE_TILES, float("inf"))
+    renderer = createRenderer(tileStore, tileCache)
+
+    # Loads the textures, which a running worker already has in memory.
+    for chunk in chunks[:16]:
+        renderer.generateTile(chunk)
+
+    started = time.perf_counter()
+    for chunk in chunks:
+        renderer.generateTile(chunk)
+    rendered = time.perf_counter()
+
+    tileCache.flush()
+    finished = time.perf_counter()
+
+    logger.info(f"Rendered {len(chunks)} chunks in {finished - started:.2f}s")
+
+    return {
+        "render.chunksPerSecond": metric(len(chunks) / (finished - started), "chunks/s", "higher"),
+        "render.drawMsPerChunk": metric((rendered - started) / len(chunks) * 1000, "ms", "lower"),
+        "render.flushSeconds": metric(finished - rendered, "s", "lower")
+    }
+
+
+def benchmarkZoom(dimension: str, zoomFilter: str, workers: int) -> Dict[str, dict]:
+    from services.zoomGenerator import ZoomGenerator
+
+    generator = ZoomGenerator(zoomFilter, workers)
+    results = {}
+
+    started = time.perf_counter()
+    tiles = {(x, y): generator._readTile((dimension, 4, x, y)) for x, y in generator._tileStore.listTiles(dimension, 4)}
+    results["zoom.readSeconds"] = metric(time.perf_counter() - started, "s", "lower")
+
+    # One level at a time in this process, so each level can be timed on its own.
+    for zoom in range(3, -1, -1):
+        started = time.perf_counter()
+        tiles = generator._buildLevel(dimension, tiles, zoom)
+        elapsed = time.perf_counter() - started
+
+        results[f"zoom.level{zoom}.seconds"] = metric(elapsed, "s", "lower")
+        results[f"zoom.level{zoom}.tiles"] = metric(len(tiles), "tiles", None)
+        logger.info(f"Zoom {zoom}: {len(tiles)} tiles in {elapsed:.2f}s")
+
+    started = time.perf_counter()
+    generator.generateZooms()
+    results["zoom.fullRebuildSeconds"] = metric(time.perf_counter() - started, "s", "lower")
+
+    return results
+
+
+def benchmarkTiles(client, dimension: str) -> Dict[str, dict]:
+    from api.tiles import tileStore
+
+    urls = [
+        f"/api/tiles/{dimension}/{zoom}/{x}/{y}"
+        for zoom in range(0, 5) for x, y in tileStore.listTiles(dimension, zoom)
+    ]
+
+    def measure(accept: str, etags: Optional[Dict[str, str]] = None) -> List[float]:
+        timings = []
+
+        for url in urls:
+            headers = {"Accept": accept}
+            if etags is not None:
+                headers["If-None-Match"] = etags[url]
+
+            started = time.perf_counter()
+            response = client.get(url, headers=headers)
+            timings.append(time.perf_counter() - started)
+
+            if response.status_code not in (200, 304):
+                raise RuntimeError(f"{url} returned {response.status_code}")
+
+        return timings
+
+    results = {}
+    results.update(percentiles("tiles.cold", measure("image/png")))
+    results.update(percentiles("tiles.hot", measure("image/png")))
+
+    # Only measured when the server answers WebP requests with WebP.
+    if config.TILE_NEGOTIATE_WEBP or config.TILE_FORMAT.startswith("webp"):
+        results.update(percentiles("tiles.webp", measure("image/webp")))
+
+    etags = {url: client.get(url, headers={"Accept": "image/png"}).headers["etag"] for url in urls}
+    results.update(percentiles("tiles.notModified", measure("image/png", etags)))
+
+    logger.info(f"Requested {len(urls)} tiles 5 times each")
+
+    return results
+
+
+def benchmarkIngest(client, tileManager, chunks: List[CompactChunkData], batchSize: int) -> Dict[str, dict]:
+    half = len(chunks) // 2
+    jsonChunks, batchChunks = chunks[:half], chunks[half:]
+
+    payloads = [chunkJson(chunk) for chunk in jsonChunks]
+    batches = [chunkBatch(batchChunks[i:i + batchSize]) for i in range(0, len(batchChunks), batchSize)]
+
+    started = time.perf_counter()
+    for payload in payloads:
+        client.post("/api/chunks-data", json=payload).raise_for_status()
+    jsonDone = time.perf_counter()
+
+    for batch in batches:
+        client.post("/api/chunks-data/batch", content=batch, headers={"Content-Type": "application/octet-stream"}).raise_for_status()
+    batchDone = time.perf_counter()
+
+    while tileManager.queueSize():
+        time.sleep(0.01)
+    drained = time.perf_counter()
+
+    logger.info(f"Sent {len(chunks)} chunks, render queue drained after {drained - started:.2f}s")
+
+    return {
+        "ingest.jsonChunksPerSecond": metric(len(jsonChunks) / (jsonDone - started), "chunks/s", "higher"),
+        "ingest.batchChunksPerSecond": metric(len(batchChunks) / (batchDone - jsonDone), "chunks/s", "higher"),
+        "ingest.pipelineChunksPerSecond": metric(len(chunks) / (drained - started), "chunks/s", "higher"),
+        "ingest.ringFallbacks": metric(tileManager.ringFallbacks, "chunks", None)
+    }
+
+
+def runBenchmarks(args: argparse.Namespace) -> dict:
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    from api.chunks import router as chunksRouter, getTileManager
+    from api.tiles import router as tilesRouter
+
+    results = {}
+
+    logger.info(f"Generating {args.grid}x{args.grid} synthetic chunks (seed {args.seed})...")
+    results.update(benchmarkRender(syntheticGrid("Overworld", args.grid, args.seed)))
+
+    if config.RENDER_MODE == "textured":
+        results.update(benchmarkZoom("Overworld", args.zoom_filter, args.zoom_workers))
+
+    # Only the routers under test, without the zoom process and player service of the full app.
+    app = FastAPI()
+    app.include_router(tilesRouter)
+    app.include_router(chunksRouter)
+
+    with TestClient(app) as client:
+        results.update(benchmarkTiles(client, "Overworld"))
+
+        tileManager = getTileManager()
+        tileManager.startWorkers()
+
+        try:
+            ingestChunks = syntheticGrid("Nether", args.grid, args.seed)
+            results.update(benchmarkIngest(client, tileManager, ingestChunks, args.batch_size))
+        finally:
+            tileManager.stopWorkers()
+
+    return results
+
+
+def compareResults(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float) -> List[str]:
+    regressions = []
+
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if result["better"] is None or previous is None or not previous["value"]:
+            continue
+
+        change = (result["value"] - previous["value"]) / previous["value"]
+        worse = -change if result["better"] == "higher" else change
+
+        status = "REGRESSION" if worse > threshold else "ok"
+        if worse > threshold:
+            regressions.append(name)
+
+        logger.info(f"{name}: {previous['value']} -> {result['value']} {result['unit']} ({change:+.1%}) {status}")
+
+    return regressions
+
+
+def main() -> None:
+    setupLogging()
+
+    parser = argparse.ArgumentParser(description="Benchmark chunk rendering, zoom generation and the tile API on synthetic terrain")
+    parser.add_argument("--grid", type=int, default=16, help="size of the N x N chunk grid (default: 16)")
+    parser.add_argument("--seed", type=int, default=1, help="seed for the synthetic terrain (default: 1)")
+    parser.add_argument("--batch-size", type=int, default=32, help="chunks per POST /api/chunks-data/batch request (default: 32)")
+    parser.add_argument("--zoom-filter", choices=["lanczos", "box"], default=config.ZOOM_FILTER, help="zoom downsampling filter (default: ZOOM_FILTER)")
+    parser.add_argument("--zoom-workers", type=int, default=config.ZOOM_WORKERS, help="processes for the full zoom rebuild (default: ZOOM_WORKERS)")
+    parser.add_argument("--output", type=Path, help="write the results to this JSON file")
+    parser.add_argument("--baseline", type=Path, help="compare against results written by an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative slowdown reported as a regression (default: 0.1)")
+    args = parser.parse_args()
+
+    if args.grid < 2:
+        parser.error("--grid must be at least 2")
+
+    # The services read the data directory when they are imported, so tiles and
+    # databases all land in a scratch directory instead of the real map.
+    scratch = Path(tempfile.mkdtemp(prefix="mipmap-benchmark-"))
+    config.WORLDS_DIR = scratch
+
+    logging.getLogger("services").setLevel(logging.WARNING)
+    logging.getLogger("api").setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    try:
+        results = runBenchmarks(args)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    report = {
+        "version": BENCHMARK_FORMAT_VERSION,
+        "createdAt": datetime.now(timezone.utc).isoformat(),
+        "environment": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "settings": {
+            "grid": args.grid, "seed": args.seed, "batchSize": args.batch_size,
+            "zoomFilter": args.zoom_filter, "zoomWorkers": args.zoom_workers,
+            "renderMode": config.RENDER_MODE, "tileStore": config.TILE_STORE, "tileFormat": config.TILE_FORMAT
+        },
+        "results": results
+    }
+
+    for name, result in results.items():
+        logger.info(f"{name}: {result['value']} {result['unit']}")
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        logger.info(f"Results written to {args.output}")
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        if baseline.get("settings") != report["settings"]:
+            logger.warning("The baseline was recorded with different settings, so the numbers may not be comparable")
+
+        regressions = compareResults(results, baseline["results"], args.threshold)
+
+        if regressions:
+            logger.error(f"{len(regressions)} regressions over {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+        logger.info(f"No regressions over {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import argparse
+
+from core.config import TILE_FORMAT, TILE_STORE
+from core.logging import setupLogging, getLogger
+
+from services.tileStore import TILE_EXTENSIONS, DirectoryTileStore, createTileStore, transcodeTile
+
+
+logger = getLogger(__name__)
+
+
+def convertTiles(sourceStore: str, sourceFormat: str, targetStore: str, targetFormat: str) -> None:
+    source = createTileStore(sourceStore, sourceFormat)
+    target = createTileStore(targetStore, targetFormat)
+
+    # Only the directory layout keeps the old files around under another extension.
+    removeSource = (
+        isinstance(source, DirectoryTileStore) and isinstance(target, DirectoryTileStore)
+        and TILE_EXTENSIONS[sourceFormat] != TILE_EXTENSIONS[targetFormat]
+    )
+
+    converted = 0
+    for dimension in source.listDimensions():
+        for zoom in range(0, 5):
+            tileCoords = source.listTiles(dimension, zoom)
+
+            for x, y in tileCoords:
+                tileKey = (dimension, zoom, x, y)
+
+                tileData = source.read(tileKey)
+                if tileData is None:
+                    continue
+
+                target.write(tileKey, transcodeTile(tileData, targetFormat))
+                if removeSource:
+                    source.delete(tileKey)
+
+            converted += len(tileCoords)
+            if tileCoords:
+                logger.info(f"{dimension} zoom {zoom}: converted {len(tileCoords)} tiles")
+
+    logger.info(f"Converted {converted} tiles to {targetFormat} ({targetStore})")
+
+
+def main() -> None:
+    setupLogging()
+
+    formats = list(TILE_EXTENSIONS)
+    stores = ["directory", "sqlite"]
+
+    parser = argparse.ArgumentParser(description="Re-encode or move existing map tiles")
+    parser.add_argument("--format", choices=formats, default=TILE_FORMAT, help="target tile format (default: TILE_FORMAT)")
+    parser.add_argument("--store", choices=stores, default=TILE_STORE, help="target tile store (default: TILE_STORE)")
+    parser.add_argument("--from-format", choices=formats, default="png", help="format of the existing tiles (default: png)")
+    parser.add_argument("--from-store", choices=stores, default=TILE_STORE, help="store holding the existing tiles (default: TILE_STORE)")
+    args = parser.parse_args()
+
+    if args.from_store == args.store and args.from_format == args.format:
+        parser.error("source and target are the same")
+
+    convertTiles(args.from_store, args.from_format, args.store, args.format)
+
+
+if __name__ == "__main__":
+    main()
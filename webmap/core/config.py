@@ -8,8 +8,40 @@ ASSETS_DIR = BASE_DIR / "assets"
 DATA_DIR = BASE_DIR / "data"
 WORLDS_DIR = DATA_DIR / "worlds"
 TILE_CACHE_MAX_AGE = 3600
-GENERATE_ZOOM_INTERVAL = 300
+TILE_STORE = "directory"
+TILE_MEMORY_CACHE_MB = 64
+TILE_FORMAT = "png"
+TILE_WEBP_QUALITY = 80
+TILE_NEGOTIATE_WEBP = False
+ZOOM_UPDATE_DEBOUNCE = 5
+ZOOM_FILTER = "lanczos"
+ZOOM_WORKERS = 0
+ZOOM_PNG_OPTIMIZE = False
+
+SKIP_UNCHANGED_CHUNKS = True
+
+RENDER_MODE = "textured"
+OVERVIEW_MAX_ZOOM = 2
+
+RENDER_CACHE_TILES = 128
+RENDER_FLUSH_INTERVAL = 5
+RENDER_QUEUE_LIMIT = 2000
+RENDER_RING_SLOTS = 1024
+RENDER_RING_SLOT_BYTES = 4096
+RENDER_ACK_LOG_SIZE = 65536
+
+FRESHNESS_WINDOW = 10000
+FRESHNESS_SAMPLE_RATE = 0.0
 
 MAP_SIZE = 2000
 MAP_UPDATE_INTERVAL = 5000
-MAP_DEFAULT_WORLD = "Overworld"
\ No newline at end of file
+MAP_DEFAULT_WORLD = "Overworld"
+
+PLAYER_STREAM_KEEPALIVE = 15
+PLAYER_STREAM_MAX_AGE = 600
+PLAYER_STREAM_QUEUE = 64
+PLAYER_MAX_PENDING_UPDATES = 2
+
+FACE_API_URL = "https://persona-secondary.franchise.minecraft-services.net/api/v1.0/profile/xuid/{xuid}/image/head"
+FACE_CACHE_TTL = 86400
+FACE_FAILURE_TTL = 600
\ No newline at end of file
@@ -4,4 +4,13 @@ app = createApp()
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+
+    from api.players import playerManager
+
+    class Server(uvicorn.Server):
+        async def shutdown(self, sockets=None):
+            # Open player streams would otherwise hold the shutdown until its timeout.
+            playerManager.closeStreams()
+            await super().shutdown(sockets)
+
+    Server(uvicorn.Config(app, host="0.0.0.0", port=8000, timeout_graceful_shutdown=5)).run()
\ No newline at end of file
@@ -1,6 +1,42 @@
-from typing import List, Tuple
+import struct
+import hashlib
 
-from pydantic import BaseModel
+import numpy as np
+
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from pydantic import BaseModel, Field
+
+
+CHUNK_MAGIC = b"MMCK"
+CHUNK_FORMAT_VERSION = 1
+CHUNK_BLOCKS = 256
+
+BATCH_MAGIC = b"MMCB"
+BATCH_FORMAT_VERSION = 1
+
+_headerStruct = struct.Struct("<4sBii")
+_batchHeaderStruct = struct.Struct("<4sBH")
+_frameLengthStruct = struct.Struct("<I")
+
+
+def chunkFingerprint(palette: List[str], indices: np.ndarray, heights: np.ndarray) -> str:
+    # Hashed over the sorted names in use, so the palette order, which depends
+    # on the upload format, does not change the fingerprint. The plugin's
+    # chunkFingerprint builds the same form.
+    indices = indices.astype(np.uint8).ravel()
+    names = sorted({palette[i] for i in np.unique(indices).tolist()})
+    rank = {name: n for n, name in enumerate(names)}
+    remap = np.array([rank.get(name, 0) for name in palette], dtype=np.uint8)
+
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update("\n".join(names).encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(remap[indices].tobytes())
+    digest.update(heights.astype("<i2").tobytes())
+
+    return digest.hexdigest()
 
 
 class BlockData(BaseModel):
@@ -24,6 +60,179 @@ class ChunkData(BaseModel):
     dimension: str
     blocks: List[BlockData]
 
+    @property
+    def chunkKey(self) -> Tuple[str, int, int]:
+        block = self.blocks[0]
+        return (self.dimension, block.x // 16, block.z // 16)
+
+    def fingerprint(self) -> str:
+        # A sorted palette keeps columns missing from partial chunks independent of block order.
+        palette = sorted({block.name for block in self.blocks})
+        rank = {name: n for n, name in enumerate(palette)}
+        indices = np.zeros(CHUNK_BLOCKS, dtype=np.uint8)
+        heights = np.zeros(CHUNK_BLOCKS, dtype=np.int16)
+
+        for block in self.blocks:
+            i = (block.z % 16) * 16 + block.x % 16
+            indices[i] = rank[block.name]
+            heights[i] = block.y
+
+        return chunkFingerprint(palette, indices, heights)
+
+    def toCompact(self) -> Optional["CompactChunkData"]:
+        dimension, chunkX, chunkZ = self.chunkKey
+
+        palette = {}
+        indices = np.zeros(CHUNK_BLOCKS, dtype=np.uint8)
+        heights = np.zeros(CHUNK_BLOCKS, dtype=np.int16)
+        covered = np.zeros(CHUNK_BLOCKS, dtype=bool)
+
+        for block in self.blocks:
+            if block.x // 16 != chunkX or block.z // 16 != chunkZ:
+                return None
+
+            i = (block.z % 16) * 16 + block.x % 16
+            indices[i] = palette.setdefault(block.name, len(palette))
+            heights[i] = block.y
+            covered[i] = True
+
+        # Partial chunks keep their own mask in the renderer.
+        if not covered.all() or len(palette) > 255:
+            return None
+
+        return CompactChunkData(dimension, chunkX, chunkZ, list(palette), indices.reshape(16, 16), heights.reshape(16, 16))
+
 
 class ChunkRequest(BaseModel):
-    chunk: ChunkData
\ No newline at end of file
+    chunk: ChunkData
+
+
+class ColumnData(BaseModel):
+    x: int = Field(ge=0, le=15)
+    z: int = Field(ge=0, le=15)
+    name: str
+    height: int
+    context: bool = False
+
+
+class ColumnUpdate(BaseModel):
+    dimension: str
+    chunkX: int
+    chunkZ: int
+    columns: List[ColumnData]
+
+    @property
+    def chunkKey(self) -> Tuple[str, int, int]:
+        return (self.dimension, self.chunkX, self.chunkZ)
+
+
+def splitChunkBatch(data: bytes) -> List[memoryview]:
+    view = memoryview(data)
+    magic, version, count = _batchHeaderStruct.unpack_from(view, 0)
+
+    if magic != BATCH_MAGIC:
+        raise ValueError("Not a MipMap chunk batch")
+    if version != BATCH_FORMAT_VERSION:
+        raise ValueError(f"Unsupported batch format version: {version}")
+
+    frames = []
+    offset = _batchHeaderStruct.size
+
+    for _ in range(count):
+        (length,) = _frameLengthStruct.unpack_from(view, offset)
+        offset += _frameLengthStruct.size
+
+        if offset + length > len(view):
+            raise ValueError("Truncated chunk batch")
+
+        frames.append(view[offset:offset + length])
+        offset += length
+
+    if offset != len(view):
+        raise ValueError("Unexpected trailing bytes in chunk batch")
+
+    return frames
+
+
+@dataclass
+class CompactChunkData:
+    dimension: str
+    chunkX: int
+    chunkZ: int
+    palette: List[str]
+    indices: np.ndarray
+    heights: np.ndarray
+
+    @property
+    def chunkKey(self) -> Tuple[str, int, int]:
+        return (self.dimension, self.chunkX, self.chunkZ)
+
+    def fingerprint(self) -> str:
+        return chunkFingerprint(self.palette, self.indices, self.heights)
+
+    def toBytes(self) -> bytes:
+        parts = [_headerStruct.pack(CHUNK_MAGIC, CHUNK_FORMAT_VERSION, self.chunkX, self.chunkZ), self._packString(self.dimension)]
+
+        parts.append(struct.pack("<H", len(self.palette)))
+        parts.extend(self._packString(name) for name in self.palette)
+
+        parts.append(self.indices.astype(np.uint8).tobytes())
+        parts.append(self.heights.astype("<i2").tobytes())
+
+        return b"".join(parts)
+
+    @classmethod
+    def fromBytes(cls, data: bytes) -> "CompactChunkData":
+        view = memoryview(data)
+        magic, version, chunkX, chunkZ = _headerStruct.unpack_from(view, 0)
+
+        if magic != CHUNK_MAGIC:
+            raise ValueError("Not a MipMap chunk payload")
+        if version != CHUNK_FORMAT_VERSION:
+            raise ValueError(f"Unsupported chunk format version: {version}")
+
+        offset = _headerStruct.size
+        dimension, offset = cls._readString(view, offset)
+
+        (paletteSize,) = struct.unpack_from("<H", view, offset)
+        offset += 2
+
+        palette = []
+        for _ in range(paletteSize):
+            name, offset = cls._readString(view, offset)
+            palette.append(name)
+
+        indices = np.frombuffer(view, dtype=np.uint8, count=CHUNK_BLOCKS, offset=offset)
+        offset += CHUNK_BLOCKS
+        heights = np.frombuffer(view, dtype="<i2", count=CHUNK_BLOCKS, offset=offset)
+        offset += CHUNK_BLOCKS * 2
+
+        if offset != len(view):
+            raise ValueError("Unexpected trailing bytes in chunk payload")
+        if paletteSize == 0 or indices.max() >= paletteSize:
+            raise ValueError("Block index outside of chunk palette")
+
+        return cls(
+            dimension=dimension,
+            chunkX=chunkX,
+            chunkZ=chunkZ,
+            palette=palette,
+            indices=indices.reshape(16, 16),
+            heights=heights.astype(np.int16).reshape(16, 16)
+        )
+
+    @staticmethod
+    def _packString(value: str) -> bytes:
+        encoded = value.encode("utf-8")
+        return struct.pack("<B", len(encoded)) + encoded
+
+    @staticmethod
+    def _readString(view: memoryview, offset: int) -> Tuple[str, int]:
+        (length,) = struct.unpack_from("<B", view, offset)
+        start = offset + 1
+        end = start + length
+
+        if end > len(view):
+            raise ValueError("Truncated chunk payload")
+
+        return bytes(view[start:end]).decode("utf-8"), end
@@ -1,13 +1,17 @@
-from typing import List
+from typing import List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+
+SKIN_HASH_PATTERN = r"^[0-9a-f]{40}$"
 
 
 class Player(BaseModel):
     name: str
     xuid: str
-    skin: str
-    skinShape: List[int]
+    skinHash: Optional[str] = Field(default=None, pattern=SKIN_HASH_PATTERN)
+    skin: Optional[str] = None
+    skinShape: Optional[List[int]] = None
     dimension: str
 
     x: float
@@ -17,3 +21,16 @@ class Player(BaseModel):
 
 class PlayersRequest(BaseModel):
     players: List[Player]
+    keyframe: bool = True
+    quit: List[str] = []
+
+
+class PlayerSkin(BaseModel):
+    hash: str = Field(pattern=SKIN_HASH_PATTERN)
+    xuid: str
+    skin: str
+    skinShape: List[int]
+
+
+class PlayerSkinsRequest(BaseModel):
+    skins: List[PlayerSkin]
@@ -0,0 +1,62 @@
+import sqlite3
+import threading
+
+from pathlib import Path
+from typing import Dict, Iterable, Tuple
+
+from core.config import WORLDS_DIR
+
+
+REGION_SHIFT = 5
+REGION_SIZE = 1 << REGION_SHIFT
+BITMAP_BYTES = REGION_SIZE * REGION_SIZE // 8
+
+
+class ChunkManifest:
+    def __init__(self, path: Path = WORLDS_DIR / "manifest.db"):
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS renderedRegions ("
+            "dimension TEXT NOT NULL, regionX INTEGER NOT NULL, regionZ INTEGER NOT NULL, "
+            "bitmap BLOB NOT NULL, PRIMARY KEY (dimension, regionX, regionZ)) WITHOUT ROWID"
+        )
+        self._connection.commit()
+
+    def markChunks(self, chunkKeys: Iterable[Tuple[str, int, int]]) -> None:
+        regions: Dict[Tuple[str, int, int], list] = {}
+
+        for dimension, chunkX, chunkZ in chunkKeys:
+            bits = regions.setdefault((dimension, chunkX >> REGION_SHIFT, chunkZ >> REGION_SHIFT), [])
+            bits.append((chunkZ & (REGION_SIZE - 1)) * REGION_SIZE + (chunkX & (REGION_SIZE - 1)))
+
+        if not regions:
+            return
+
+        with self._lock, self._connection:
+            for regionKey, bits in regions.items():
+                row = self._connection.execute(
+                    "SELECT bitmap FROM renderedRegions WHERE dimension = ? AND regionX = ? AND regionZ = ?", regionKey
+                ).fetchone()
+
+                bitmap = bytearray(row[0] if row is not None else BITMAP_BYTES)
+                for bit in bits:
+                    bitmap[bit >> 3] |= 1 << (bit & 7)
+
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO renderedRegions (dimension, regionX, regionZ, bitmap) VALUES (?, ?, ?, ?)",
+                    (*regionKey, bytes(bitmap))
+                )
+
+    def regions(self, dimension: str, minChunkX: int, minChunkZ: int, maxChunkX: int, maxChunkZ: int) -> Dict[Tuple[int, int], bytes]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT regionX, regionZ, bitmap FROM renderedRegions "
+                "WHERE dimension = ? AND regionX BETWEEN ? AND ? AND regionZ BETWEEN ? AND ?",
+                (dimension, minChunkX >> REGION_SHIFT, maxChunkX >> REGION_SHIFT, minChunkZ >> REGION_SHIFT, maxChunkZ >> REGION_SHIFT)
+            ).fetchall()
+
+        return {(regionX, regionZ): bitmap for regionX, regionZ, bitmap in rows}
@@ -0,0 +1,37 @@
+from multiprocessing.sharedctypes import RawArray
+from typing import Optional, Tuple
+
+
+class ChunkRing:
+    # Filled by the API process and freed by one render worker. Slots are used
+    # in order and the worker reads descriptors in the same order, so the ring
+    # is full exactly when the next slot has not been freed yet.
+    def __init__(self, slots: int, slotBytes: int):
+        self.slots = slots
+        self.slotBytes = slotBytes
+
+        self._data = RawArray("B", slots * slotBytes)
+        self._states = RawArray("B", slots)
+        self._next = 0
+
+    def put(self, frame: bytes) -> Optional[Tuple[int, int]]:
+        slot = self._next
+
+        if len(frame) > self.slotBytes or self._states[slot]:
+            return None
+
+        start = slot * self.slotBytes
+        memoryview(self._data).cast("B")[start:start + len(frame)] = frame
+
+        self._states[slot] = 1
+        self._next = (slot + 1) % self.slots
+
+        return slot, len(frame)
+
+    def take(self, slot: int, length: int) -> bytes:
+        start = slot * self.slotBytes
+        frame = bytes(memoryview(self._data).cast("B")[start:start + length])
+
+        self._states[slot] = 0
+
+        return frame
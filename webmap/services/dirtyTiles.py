@@ -0,0 +1,38 @@
+import sqlite3
+
+from pathlib import Path
+from typing import Iterable, List, Tuple
+
+from core.config import WORLDS_DIR
+
+
+class DirtyTileJournal:
+    def __init__(self, path: Path = WORLDS_DIR / "dirty-tiles.db"):
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS dirtyTiles ("
+            "dimension TEXT NOT NULL, x INTEGER NOT NULL, y INTEGER NOT NULL, "
+            "PRIMARY KEY (dimension, x, y))"
+        )
+
+    def markTiles(self, tileKeys: Iterable[Tuple[str, int, int, int]], zoom: int = 4) -> None:
+        self.mark([(dimension, x, y) for dimension, tileZoom, x, y in tileKeys if tileZoom == zoom])
+
+    def mark(self, tiles: List[Tuple[str, int, int]]) -> None:
+        if not tiles:
+            return
+
+        with self._connection:
+            self._connection.execute("BEGIN IMMEDIATE")
+            self._connection.executemany("INSERT OR IGNORE INTO dirtyTiles (dimension, x, y) VALUES (?, ?, ?)", tiles)
+
+    def take(self) -> List[Tuple[str, int, int]]:
+        with self._connection:
+            self._connection.execute("BEGIN IMMEDIATE")
+            tiles = self._connection.execute("SELECT dimension, x, y FROM dirtyTiles").fetchall()
+            self._connection.execute("DELETE FROM dirtyTiles")
+
+        return tiles
@@ -0,0 +1,55 @@
+import time
+import sqlite3
+import threading
+
+from pathlib import Path
+from typing import Optional, Tuple
+
+from core.config import FACE_CACHE_TTL, FACE_FAILURE_TTL
+
+
+class FaceCache:
+    def __init__(self, path: Path, ttl: float = FACE_CACHE_TTL, failureTtl: float = FACE_FAILURE_TTL):
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.ttl = ttl
+        self.failureTtl = failureTtl
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS faces ("
+            "xuid TEXT PRIMARY KEY, face BLOB, fetchedAt REAL, failedAt REAL)"
+        )
+        self._connection.commit()
+
+    def get(self, xuid: str) -> Tuple[Optional[bytes], bool]:
+        with self._lock:
+            row = self._connection.execute("SELECT face, fetchedAt, failedAt FROM faces WHERE xuid = ?", (xuid,)).fetchone()
+
+        if row is None:
+            return None, False
+
+        face, fetchedAt, failedAt = row
+        now = time.time()
+
+        fresh = (fetchedAt is not None and now - fetchedAt < self.ttl) or (failedAt is not None and now - failedAt < self.failureTtl)
+        return face, fresh
+
+    def put(self, xuid: str, face: Optional[bytes]) -> Optional[bytes]:
+        now = time.time()
+
+        with self._lock, self._connection:
+            if face is not None:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO faces (xuid, face, fetchedAt, failedAt) VALUES (?, ?, ?, NULL)", (xuid, face, now)
+                )
+                return face
+
+            # A failed refresh keeps the last face that was fetched.
+            self._connection.execute(
+                "INSERT INTO faces (xuid, failedAt) VALUES (?, ?) ON CONFLICT (xuid) DO UPDATE SET failedAt = excluded.failedAt", (xuid, now)
+            )
+            row = self._connection.execute("SELECT face FROM faces WHERE xuid = ?", (xuid,)).fetchone()
+
+        return row[0]
@@ -0,0 +1,40 @@
+import sqlite3
+import threading
+
+from pathlib import Path
+from typing import Iterable, Optional, Tuple
+
+from core.config import WORLDS_DIR
+
+
+class FingerprintStore:
+    def __init__(self, path: Path = WORLDS_DIR / "fingerprints.db"):
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS fingerprints ("
+            "dimension TEXT NOT NULL, chunkX INTEGER NOT NULL, chunkZ INTEGER NOT NULL, "
+            "fingerprint TEXT NOT NULL, PRIMARY KEY (dimension, chunkX, chunkZ))"
+        )
+        self._connection.commit()
+
+    def isUnchanged(self, key: Tuple[str, int, int], fingerprint: str) -> bool:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT fingerprint FROM fingerprints WHERE dimension = ? AND chunkX = ? AND chunkZ = ?", key
+            ).fetchone()
+
+        return row is not None and row[0] == fingerprint
+
+    def updateMany(self, fingerprints: Iterable[Tuple[Tuple[str, int, int], Optional[str]]]) -> None:
+        rows = [(*key, fingerprint) for key, fingerprint in fingerprints if fingerprint is not None]
+        if not rows:
+            return
+
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO fingerprints (dimension, chunkX, chunkZ, fingerprint) VALUES (?, ?, ?, ?)", rows
+            )
+            self._connection.commit()
@@ -0,0 +1,154 @@
+import json
+import queue
+import random
+
+import numpy as np
+
+from collections import OrderedDict, deque
+from multiprocessing import Queue
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from core.config import DATA_DIR, RENDER_MODE, FRESHNESS_WINDOW, FRESHNESS_SAMPLE_RATE
+from core.logging import getLogger
+
+from .metrics import metrics
+
+
+logger = getLogger(__name__)
+
+# Timestamps a chunk collects on its way to the map, in order. The first four
+# are taken by the plugin, the rest by the web server and its workers.
+STAGES = ("loaded", "scanned", "dequeued", "sent", "received", "renderStarted", "saved", "zoomed")
+
+ChunkKey = Tuple[str, int, int]
+
+# Render workers report ("saved", [(chunkKey, stamps), ...]); the zoom process
+# reports ("zoomed", finishedAt, tiles) after each pass.
+traceQueue = Queue()
+
+
+class FreshnessTracker:
+    def __init__(self, window: int = FRESHNESS_WINDOW, sampleRate: float = FRESHNESS_SAMPLE_RATE,
+                 logPath: Path = DATA_DIR / "chunk-traces.jsonl", waitForZoom: bool = RENDER_MODE == "textured"):
+        self.window = window
+        self.sampleRate = sampleRate
+        self.logPath = logPath
+        self.waitForZoom = waitForZoom
+
+        self._durations = {stage: deque(maxlen=window) for stage in (*STAGES[1:], "total")}
+        self._awaitingZoom: "OrderedDict[ChunkKey, List[list]]" = OrderedDict()
+        self._awaitingCount = 0
+
+    @property
+    def pending(self) -> int:
+        return self._awaitingCount
+
+    def collect(self, traceQueue: Queue) -> None:
+        while True:
+            try:
+                event = traceQueue.get_nowait()
+            except queue.Empty:
+                return
+
+            if event[0] == "saved":
+                for chunkKey, stamps in event[1]:
+                    self._saved(tuple(chunkKey), stamps)
+            elif event[0] == "zoomed":
+                self._zoomed(event[1], event[2])
+
+    def summary(self) -> Dict[str, dict]:
+        stages = {}
+
+        for stage, durations in self._durations.items():
+            if not durations:
+                stages[stage] = {"count": 0}
+                continue
+
+            values = np.fromiter(durations, dtype=np.float64)
+            p50, p90, p99 = np.percentile(values, [50, 90, 99])
+
+            stages[stage] = {
+                "count": len(values),
+                "p50": round(float(p50), 3),
+                "p90": round(float(p90), 3),
+                "p99": round(float(p99), 3),
+                "max": round(float(values.max()), 3)
+            }
+
+        return stages
+
+    def _saved(self, chunkKey: ChunkKey, stamps: list) -> None:
+        if not self.waitForZoom:
+            self._finish(chunkKey, stamps)
+            return
+
+        self._awaitingZoom.setdefault(chunkKey, []).append(stamps)
+        self._awaitingCount += 1
+
+        # Chunks whose zoom pass never came are given up on, oldest first.
+        while self._awaitingCount > self.window:
+            _, dropped = self._awaitingZoom.popitem(last=False)
+            self._awaitingCount -= len(dropped)
+
+    def _zoomed(self, finishedAt: float, tiles: List[ChunkKey]) -> None:
+        for tile in tiles:
+            traces = self._awaitingZoom.get(tuple(tile))
+            if not traces:
+                continue
+
+            # A pass only covers chunks that were saved before it finished.
+            covered = [stamps for stamps in traces if stamps[-1] <= finishedAt]
+            remaining = [stamps for stamps in traces if stamps[-1] > finishedAt]
+
+            if remaining:
+                self._awaitingZoom[tuple(tile)] = remaining
+            else:
+                del self._awaitingZoom[tuple(tile)]
+
+            self._awaitingCount -= len(covered)
+            for stamps in covered:
+                self._finish(tuple(tile), stamps + [finishedAt])
+
+    def _finish(self, chunkKey: ChunkKey, stamps: list) -> None:
+        for stage, start, end in zip(STAGES[1:], stamps, stamps[1:]):
+            self._durations[stage].append(end - start)
+            metrics.observe("mipmap_chunk_freshness_seconds", max(0.0, end - start), stage=stage)
+
+        self._durations["total"].append(stamps[-1] - stamps[0])
+
+        if self.sampleRate and random.random() < self.sampleRate:
+            self._writeTrace(chunkKey, stamps)
+
+    def _writeTrace(self, chunkKey: ChunkKey, stamps: list) -> None:
+        dimension, chunkX, chunkZ = chunkKey
+        trace = {"dimension": dimension, "chunkX": chunkX, "chunkZ": chunkZ, **dict(zip(STAGES, stamps))}
+
+        try:
+            with open(self.logPath, "a", encoding="utf-8") as f:
+                f.write(json.dumps(trace) + "\n")
+
+        except OSError as e:
+            logger.error(f"Error writing chunk trace: {e}")
+
+
+def parseTraces(header: Optional[str], count: int, receivedAt: float) -> List[Optional[list]]:
+    # X-MipMap-Trace: {"sentAt": ..., "chunks": [[loaded, scanned, dequeued], ...]}
+    # with one entry per chunk of the request, in order.
+    if not header:
+        return [None] * count
+
+    try:
+        trace = json.loads(header)
+        sentAt = float(trace["sentAt"])
+        chunks = trace["chunks"]
+
+        traces = [
+            [*map(float, stamps), sentAt, receivedAt] if stamps is not None and len(stamps) == 3 else None
+            for stamps in chunks[:count]
+        ]
+
+    except (ValueError, KeyError, TypeError):
+        return [None] * count
+
+    return traces + [None] * (count - len(traces))
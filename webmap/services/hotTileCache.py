@@ -0,0 +1,44 @@
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+
+
+class HotTileCache:
+    def __init__(self, maxBytes: int):
+        self.maxBytes = maxBytes
+        self.size = 0
+
+        self._tiles: "OrderedDict[Hashable, Tuple[bytes, int]]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, version: int) -> Optional[bytes]:
+        tile = self._tiles.get(key)
+
+        if tile is None or tile[1] != version:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._tiles.move_to_end(key)
+
+        return tile[0]
+
+    def put(self, key: Hashable, data: bytes, version: int) -> None:
+        self.discard(key)
+
+        if len(data) > self.maxBytes:
+            return
+
+        self._tiles[key] = (data, version)
+        self.size += len(data)
+
+        while self.size > self.maxBytes:
+            _, (evicted, _) = self._tiles.popitem(last=False)
+            self.size -= len(evicted)
+
+    def discard(self, key: Hashable) -> None:
+        tile = self._tiles.pop(key, None)
+
+        if tile is not None:
+            self.size -= len(tile[0])
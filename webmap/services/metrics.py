@@ -0,0 +1,149 @@
+import time
+import queue
+import bisect
+import threading
+
+from contextlib import contextmanager
+from multiprocessing import Queue
+from typing import Dict, Tuple
+
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+DURATION_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+
+METRICS = {
+    "mipmap_render_queue_depth": ("gauge", "Tasks waiting for each render worker", None),
+    "mipmap_chunks_rendered_total": ("counter", "Chunks drawn by the render workers", None),
+    "mipmap_render_ring_fallbacks_total": ("counter", "Chunks passed to a render worker through its queue because its shared buffer was full", None),
+    "mipmap_render_stage_seconds": ("histogram", "Time spent on one tile in each render stage", LATENCY_BUCKETS),
+    "mipmap_tile_flush_seconds": ("histogram", "Time to write one flush of rendered tiles to the tile store", LATENCY_BUCKETS),
+    "mipmap_tile_bytes_written_total": ("counter", "Encoded tile bytes written to the tile store", None),
+    "mipmap_zoom_duration_seconds": ("histogram", "Duration of zoom generation runs", DURATION_BUCKETS),
+    "mipmap_zoom_tiles_total": ("counter", "Zoom tiles written, by zoom level", None),
+    "mipmap_tile_requests_total": ("counter", "Tile requests, by how they were answered", None),
+    "mipmap_tile_request_seconds": ("histogram", "Time to answer a tile request", LATENCY_BUCKETS),
+    "mipmap_player_updates_total": ("counter", "Player updates received from the plugin", None),
+    "mipmap_chunk_freshness_seconds": ("histogram", "Time a chunk spent in each stage between being loaded in game and shown on the map", DURATION_BUCKETS),
+}
+
+MetricKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+# Render and zoom processes publish what they counted since the last publish;
+# the web server adds it to its own values, so nothing is counted twice.
+metricsQueue = Queue()
+
+
+def escapeLabel(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values: Dict[MetricKey, object] = {}
+        self._published = time.monotonic()
+
+    def inc(self, name: str, amount: float = 1, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            self._values[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        buckets = METRICS[name][2]
+        key = (name, tuple(sorted(labels.items())))
+
+        with self._lock:
+            # One count per bucket plus +Inf, then the sum.
+            histogram = self._values.get(key)
+            if histogram is None:
+                histogram = self._values[key] = [0] * (len(buckets) + 1) + [0.0]
+
+            histogram[bisect.bisect_left(buckets, value)] += 1
+            histogram[-1] += value
+
+    @contextmanager
+    def timed(self, name: str, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values = {}
+
+    def takeDelta(self) -> Dict[MetricKey, object]:
+        with self._lock:
+            delta, self._values = self._values, {}
+
+        return delta
+
+    def merge(self, delta: Dict[MetricKey, object]) -> None:
+        with self._lock:
+            for key, value in delta.items():
+                current = self._values.get(key)
+
+                if isinstance(value, list):
+                    self._values[key] = value if current is None else [a + b for a, b in zip(current, value)]
+                else:
+                    self._values[key] = (current or 0) + value
+
+    def publish(self, metricsQueue: Queue, interval: float = 1.0) -> None:
+        now = time.monotonic()
+        if now - self._published < interval:
+            return
+
+        self._published = now
+
+        delta = self.takeDelta()
+        if delta:
+            metricsQueue.put(delta)
+
+    def collect(self, metricsQueue: Queue) -> None:
+        while True:
+            try:
+                self.merge(metricsQueue.get_nowait())
+            except queue.Empty:
+                return
+
+    def render(self) -> str:
+        with self._lock:
+            values = dict(self._values)
+
+        lines = []
+        for name, (metricType, description, buckets) in METRICS.items():
+            samples = sorted(((labels, value) for (metricName, labels), value in values.items() if metricName == name), key=lambda sample: sample[0])
+
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {metricType}")
+
+            for labels, value in samples:
+                if metricType != "histogram":
+                    lines.append(f"{name}{self._formatLabels(labels)} {value}")
+                    continue
+
+                cumulative = 0
+                for bound, count in zip([*buckets, "+Inf"], value[:-1]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{self._formatLabels(labels + (('le', str(bound)),))} {cumulative}")
+
+                lines.append(f"{name}_sum{self._formatLabels(labels)} {value[-1]}")
+                lines.append(f"{name}_count{self._formatLabels(labels)} {cumulative}")
+
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _formatLabels(labels: tuple) -> str:
+        if not labels:
+            return ""
+
+        return "{" + ",".join(f'{key}="{escapeLabel(str(value))}"' for key, value in labels) + "}"
+
+
+metrics = Metrics()
@@ -1,14 +1,22 @@
+import io
+import os
+import time
+import asyncio
+import hashlib
 import aiohttp
-import aiofiles
 
 import numpy as np
 
 from PIL import Image
 from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
 
-from models.player import PlayersRequest, Player
+from models.player import PlayersRequest, PlayerSkinsRequest, Player
+from core.config import PLAYER_STREAM_QUEUE, PLAYER_MAX_PENDING_UPDATES, FACE_API_URL
 from core.logging import getLogger
 
+from .faceCache import FaceCache
+
 
 logger = getLogger(__name__)
 
@@ -16,62 +24,248 @@ logger = getLogger(__name__)
 class PlayerManager:
     def __init__(self):
         self._players = []
+        self._subscribers = set()
+        self._updateLock = asyncio.Lock()
+        self._pendingUpdates = 0
 
         self.skinsPath = Path("data/skins")
         self.skinsPath.mkdir(exist_ok=True)
+        self.facesPath = self.skinsPath / "faces"
+        self.facesPath.mkdir(exist_ok=True)
+
+        self._skinHashes: Dict[str, str] = {}
+        self._knownSkins = {path.stem for path in self.facesPath.glob("*.png")}
+        self._failedSkins: Dict[str, float] = {}
+
+        self._faceCache = FaceCache(self.skinsPath / "faces.db")
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._faceFetches: Dict[str, asyncio.Task] = {}
+        self._faceStores: Dict[str, asyncio.Task] = {}
 
     @property
     def players(self):
         return self._players
 
-    async def _getFacePlayerXuid(self, player: Player) -> str:
-        skinPath = self.skinsPath / f"{player.name}.png"
-        defaultSkinPath = self.skinsPath / "default.png"
+    @property
+    def isBusy(self) -> bool:
+        return self._pendingUpdates >= PLAYER_MAX_PENDING_UPDATES
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=PLAYER_STREAM_QUEUE)
+        self._subscribers.add(queue)
+
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def closeStreams(self):
+        # Tells every open stream to end so the server can shut down.
+        for queue in self._subscribers:
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(("close", None))
+
+    def _publish(self, deltas: List[dict]):
+        for queue in self._subscribers:
+            try:
+                queue.put_nowait(("delta", deltas))
+
+            except asyncio.QueueFull:
+                # A client that fell behind gets a fresh snapshot instead of stale moves.
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(("snapshot", self._players))
+
+    def _diffPlayers(self, previous: List[dict], current: List[dict]) -> List[dict]:
+        previousByName: Dict[str, dict] = {player["name"]: player for player in previous}
+        currentByName: Dict[str, dict] = {player["name"]: player for player in current}
+        deltas = []
+
+        for name, player in currentByName.items():
+            old = previousByName.get(name)
+
+            if old is None:
+                deltas.append({"type": "join", "player": player})
+            elif old["dimension"] != player["dimension"]:
+                deltas.append({"type": "dimension", "name": name, "dimension": player["dimension"], "x": player["x"], "y": player["y"], "z": player["z"]})
+            elif (old["x"], old["y"], old["z"]) != (player["x"], player["y"], player["z"]):
+                deltas.append({"type": "move", "name": name, "x": player["x"], "y": player["y"], "z": player["z"]})
+
+        for name in previousByName.keys() - currentByName.keys():
+            deltas.append({"type": "quit", "name": name})
+
+        return deltas
+
+    def facePath(self, name: str) -> Path:
+        skinHash = self._skinHashes.get(name)
+
+        if skinHash is not None:
+            facePath = self.facesPath / f"{skinHash}.png"
+            if facePath.exists():
+                return facePath
 
-        url = f"https://persona-secondary.franchise.minecraft-services.net/api/v1.0/profile/xuid/{player.xuid}/image/head"
+        return self.skinsPath / "default.png"
+
+    def _getSession(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=5))
+
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+    def _runOnce(self, tasks: Dict[str, asyncio.Task], key: str, factory: Callable[[], Awaitable]) -> asyncio.Task:
+        task = tasks.get(key)
+
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            tasks[key] = task
+            task.add_done_callback(lambda _: tasks.pop(key, None))
+
+        return task
+
+    async def _getFacePlayerXuid(self, xuid: str) -> Optional[bytes]:
+        face, fresh = await asyncio.to_thread(self._faceCache.get, xuid)
+        if fresh:
+            return face
+
+        return await self._runOnce(self._faceFetches, xuid, lambda: self._fetchFace(xuid))
+
+    async def _fetchFace(self, xuid: str) -> Optional[bytes]:
+        face = None
 
         try:
-            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=5)) as session:
-                async with session.get(url) as response:
-                    response.raise_for_status()
-                    
-                    async with aiofiles.open(skinPath, 'wb') as file:
-                        async for chunk in response.content.iter_chunked(8192):
-                            await file.write(chunk)
-                    
-                    return str(skinPath)
-
-        except:
-            return str(defaultSkinPath)
-                    
-
-    async def _getFacePlayer(self, player: Player) -> str:
-        skinBytes = bytes.fromhex(player.skin)
-        skinArray = np.frombuffer(skinBytes, dtype=np.uint8)
-        skinImage = skinArray.reshape(tuple(player.skinShape))
-        
-        image = Image.fromarray(skinImage)
+            async with self._getSession().get(FACE_API_URL.format(xuid=xuid)) as response:
+                response.raise_for_status()
+                face = await response.read()
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"Could not fetch face for xuid {xuid}: {e}")
+
+        return await asyncio.to_thread(self._faceCache.put, xuid, face)
+
+    @staticmethod
+    def _hashSkin(skinHex: str) -> Tuple[bytes, str]:
+        skinBytes = bytes.fromhex(skinHex)
+        return skinBytes, hashlib.sha1(skinBytes).hexdigest()
+
+    @staticmethod
+    def _cropFace(skinBytes: bytes, skinShape: List[int]) -> Optional[bytes]:
+        image = Image.fromarray(np.frombuffer(skinBytes, dtype=np.uint8).reshape(tuple(skinShape)))
         width, height = image.size
         
         if width != 64 or height not in (64, 32):
-            return await self._getFacePlayerXuid(player)
-        
-        else:
-            skinPath = self.skinsPath / f"{player.name}.png"
-            face = image.crop((8, 8, 16, 16))
-            face.save(skinPath)
-            
-            return str(skinPath)
-            
-    async def updatePlayers(self, playersData: PlayersRequest):
-        self._players = [
-            {
+            return None
+
+        buffer = io.BytesIO()
+        image.crop((8, 8, 16, 16)).save(buffer, format="PNG")
+
+        return buffer.getvalue()
+
+    def _writeFace(self, skinHash: str, face: bytes) -> None:
+        facePath = self.facesPath / f"{skinHash}.png"
+        tempPath = facePath.with_name(f".{facePath.name}.tmp")
+
+        tempPath.write_bytes(face)
+        os.replace(tempPath, facePath)
+
+    async def _storeFace(self, xuid: str, skinHex: str, skinShape: List[int], expectedHash: Optional[str] = None) -> Optional[str]:
+        skinBytes, skinHash = await asyncio.to_thread(self._hashSkin, skinHex)
+
+        if expectedHash is not None and skinHash != expectedHash:
+            logger.warning(f"Skin upload for xuid {xuid} does not match its hash")
+            return None
+
+        if not self._isMissing(skinHash):
+            return skinHash
+
+        face = await asyncio.to_thread(self._cropFace, skinBytes, skinShape)
+        if face is None:
+            face = await self._getFacePlayerXuid(xuid)
+
+        if face is None:
+            # Ask for this skin again only once the failure has expired.
+            self._failedSkins[skinHash] = time.monotonic() + self._faceCache.failureTtl
+            return skinHash
+
+        await asyncio.to_thread(self._writeFace, skinHash, face)
+        self._knownSkins.add(skinHash)
+        self._failedSkins.pop(skinHash, None)
+
+        return skinHash
+
+    def _isMissing(self, skinHash: str) -> bool:
+        return skinHash not in self._knownSkins and self._failedSkins.get(skinHash, 0) <= time.monotonic()
+
+    async def storeSkins(self, skinsData: PlayerSkinsRequest) -> int:
+        skins = {skin.hash: skin for skin in skinsData.skins if self._isMissing(skin.hash)}
+
+        stored = await asyncio.gather(*(
+            self._runOnce(self._faceStores, skinHash, lambda skin=skin: self._storeFace(skin.xuid, skin.skin, skin.skinShape, skin.hash))
+            for skinHash, skin in skins.items()
+        ))
+
+        return sum(skinHash is not None and skinHash in self._knownSkins for skinHash in stored)
+
+    async def _resolveSkin(self, player: Player, missingSkins: List[str]) -> Optional[str]:
+        if player.skinHash is not None:
+            if self._isMissing(player.skinHash):
+                missingSkins.append(player.skinHash)
+
+            return player.skinHash
+
+        if player.skin is None or player.skinShape is None:
+            return None
+
+        # Older plugins still send the whole skin with every update.
+        return await self._storeFace(player.xuid, player.skin, player.skinShape)
+
+    async def updatePlayers(self, playersData: PlayersRequest) -> List[str]:
+        self._pendingUpdates += 1
+
+        try:
+            # Deltas must be applied in the order they arrived.
+            async with self._updateLock:
+                return await self._applyUpdate(playersData)
+
+        finally:
+            self._pendingUpdates -= 1
+
+    async def _applyUpdate(self, playersData: PlayersRequest) -> List[str]:
+        previous = self._players
+        missingSkins = []
+
+        skinHashes = await asyncio.gather(*(self._resolveSkin(player, missingSkins) for player in playersData.players))
+
+        for player, skinHash in zip(playersData.players, skinHashes):
+            if skinHash is not None:
+                self._skinHashes[player.name] = skinHash
+
+        updated = {
+            player.name: {
                 "x": player.x,
                 "y": player.y,
                 "z": player.z,
                 "name": player.name,
                 "dimension": player.dimension,
-                "skin": await self._getFacePlayer(player)
+                "skin": self._skinHashes.get(player.name)
             }
             for player in playersData.players
-        ]
+        }
+
+        if playersData.keyframe:
+            current = updated
+        else:
+            current = {player["name"]: player for player in previous if player["name"] not in playersData.quit}
+            current.update(updated)
+
+        self._players = list(current.values())
+
+        deltas = self._diffPlayers(previous, self._players)
+        if deltas:
+            self._publish(deltas)
+
+        return missingSkins
@@ -0,0 +1,47 @@
+import asyncio
+
+from collections import deque
+from itertools import islice
+from typing import Iterable, List, Optional, Tuple
+
+from core.config import RENDER_ACK_LOG_SIZE
+
+
+ChunkKey = Tuple[str, int, int]
+
+
+class RenderLog:
+    def __init__(self, maxEntries: int = RENDER_ACK_LOG_SIZE):
+        self._entries: "deque[ChunkKey]" = deque(maxlen=maxEntries)
+        self._cursor = 0
+        self._changed: Optional[asyncio.Event] = None
+
+    @property
+    def cursor(self) -> int:
+        return self._cursor
+
+    def append(self, chunkKeys: Iterable[ChunkKey]) -> None:
+        for chunkKey in chunkKeys:
+            self._entries.append(chunkKey)
+            self._cursor += 1
+
+        if self._changed is not None:
+            self._changed.set()
+            self._changed = None
+
+    def since(self, after: int) -> List[ChunkKey]:
+        # Entries older than the log are gone; the caller only gets what is left.
+        missed = self._cursor - after
+        return list(islice(self._entries, max(0, len(self._entries) - missed), None))
+
+    async def wait(self, after: int, timeout: float) -> Tuple[int, List[ChunkKey]]:
+        if after >= self._cursor:
+            if self._changed is None:
+                self._changed = asyncio.Event()
+
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+        return self._cursor, self.since(after)
@@ -0,0 +1,92 @@
+import time
+
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from PIL import Image
+
+from .metrics import metrics
+from .tileStore import TileKey, TileStore, encodeTile
+
+
+def writeTiles(tileStore: TileStore, tiles: Dict[TileKey, Image.Image]) -> None:
+    encoded = {}
+    for tileKey, tileImage in tiles.items():
+        with metrics.timed("mipmap_render_stage_seconds", stage="encode"):
+            encoded[tileKey] = encodeTile(tileImage)
+
+    # Stores write a flush in one go, so it is timed as a whole.
+    with metrics.timed("mipmap_tile_flush_seconds"):
+        tileStore.writeMany(encoded)
+
+    metrics.inc("mipmap_tile_bytes_written_total", sum(map(len, encoded.values())), source="render")
+
+
+class TileCache:
+    def __init__(self, tileStore: TileStore, maxTiles: int, flushInterval: float, onWritten: Optional[Callable[[List[TileKey]], None]] = None):
+        self.tileStore = tileStore
+        self.maxTiles = maxTiles
+        self.flushInterval = flushInterval
+        self.onWritten = onWritten
+
+        self._tiles: "OrderedDict[TileKey, Image.Image]" = OrderedDict()
+        self._dirty = set()
+        self._written: List[TileKey] = []
+        self._lastFlush = time.monotonic()
+
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    @property
+    def dirtyTiles(self) -> int:
+        return len(self._dirty)
+
+    def get(self, tileKey: TileKey) -> Optional[Image.Image]:
+        tileImage = self._tiles.get(tileKey)
+
+        if tileImage is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._tiles.move_to_end(tileKey)
+
+        return tileImage
+
+    def put(self, tileKey: TileKey, tileImage: Image.Image, dirty: bool = True) -> None:
+        self._tiles[tileKey] = tileImage
+        self._tiles.move_to_end(tileKey)
+
+        if dirty:
+            self._dirty.add(tileKey)
+
+        while len(self._tiles) > self.maxTiles:
+            evictedKey, evictedImage = self._tiles.popitem(last=False)
+
+            if evictedKey in self._dirty:
+                self._write({evictedKey: evictedImage})
+
+    def flushDue(self) -> bool:
+        return bool(self._dirty or self._written) and time.monotonic() - self._lastFlush >= self.flushInterval
+
+    def flush(self) -> int:
+        flushed = len(self._dirty)
+
+        if self._dirty:
+            self._write({tileKey: self._tiles[tileKey] for tileKey in self._dirty})
+
+        if self.onWritten is not None and self._written:
+            self.onWritten(self._written)
+
+        self._written = []
+        self._lastFlush = time.monotonic()
+
+        return flushed
+
+    def _write(self, tiles: Dict[TileKey, Image.Image]) -> None:
+        writeTiles(self.tileStore, tiles)
+
+        self._dirty.difference_update(tiles)
+        self._written.extend(tiles)
+        self.writes += len(tiles)
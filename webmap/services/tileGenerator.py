@@ -1,40 +1,74 @@
 import json
 
+import numpy as np
+
 from pathlib import Path
+from typing import Optional, Union
+
+from PIL import Image
 
-from PIL import Image, ImageEnhance
+from models.chunk import ChunkData, CompactChunkData, ColumnUpdate
 
-from models.chunk import ChunkData, BlockData
-from core.config import WORLDS_DIR
+from .metrics import metrics
+from .tileCache import TileCache, writeTiles
+from .tileStore import TileKey, TileStore, createTileStore, decodeTile
+from .tileShader import TileShader
 
 
 class TextureLoader:
     _texturePath = Path("assets/textures/blocks")
     _failedTexturesFile = Path("data/failedTextures.json")
     
-    def __init__(self):
+    def __init__(self, textureSize: int = 16):
+        self._textureSize = textureSize
         self._textureCache = {}
+        self._averageColorCache = {}
         self._failedTextures = set()
         self._texturePath.mkdir(parents=True, exist_ok=True)
         self._loadFailedTextures()
     
-    def getTexture(self, block: BlockData) -> Image.Image:
-        textureName = f"{block.name.removeprefix('minecraft:')}.png"
+    def getTexture(self, name: str) -> np.ndarray:
+        textureName = f"{name.removeprefix('minecraft:')}.png"
         textureFile = self._texturePath / textureName
 
         if textureName not in self._textureCache:
             if textureFile.exists():
                 try:
-                    self._textureCache[textureName] = Image.open(textureFile)
+                    self._textureCache[textureName] = self._toPixels(Image.open(textureFile))
                 except:
-                    self._textureCache[textureName] = self._getFallbackTexture()
+                    self._textureCache[textureName] = self._toPixels(self._getFallbackTexture())
                     self._addFailedTexture(textureName)
             else:
-                self._textureCache[textureName] = self._getFallbackTexture()
+                self._textureCache[textureName] = self._toPixels(self._getFallbackTexture())
                 self._addFailedTexture(textureName)
         
         return self._textureCache.get(textureName)
 
+    def getAverageColor(self, name: str) -> np.ndarray:
+        if name not in self._averageColorCache:
+            pixels = self.getTexture(name).reshape(-1, 4).astype(np.float64)
+            alpha = pixels[:, 3]
+
+            color = np.zeros(4, dtype=np.float64)
+            if alpha.sum() > 0:
+                color[:3] = (pixels[:, :3] * alpha[:, None]).sum(axis=0) / alpha.sum()
+            color[3] = alpha.mean()
+
+            self._averageColorCache[name] = np.rint(color).astype(np.uint8).reshape(1, 1, 4)
+
+        return self._averageColorCache[name]
+
+    def _toPixels(self, texture: Image.Image) -> np.ndarray:
+        size = self._textureSize
+        texture = texture.convert("RGBA")
+
+        if texture.width < size or texture.height < size:
+            texture = texture.resize((size, size), Image.Resampling.NEAREST)
+
+        # Animated strips and HD textures keep only their top-left block, which is
+        # all that stayed visible once neighbouring blocks were pasted over them.
+        return np.ascontiguousarray(np.asarray(texture)[:size, :size])
+
     def _getFallbackTexture(self) -> Image.Image:
         fallbackPath = self._texturePath / "bug.png"
 
@@ -65,182 +99,176 @@ class TextureLoader:
 
 
 class TileRenderer:
-    def __init__(self):
+    def __init__(self, tileStore: Optional[TileStore] = None, tileCache: Optional[TileCache] = None):
         self._tileSize = 256
         self._blockSize = 16
-        self._textureLoader = TextureLoader()
-        
-        self._minHeight = -64
-        self._maxHeight = 320
-        self._seaLevel = 63
+        self._baseZoom = 4
+        self._tileStore = tileStore or createTileStore()
+        self._tileCache = tileCache
+        self._textureLoader = TextureLoader(self._blockSize)
+        self._shader = TileShader(minHeight=-64, maxHeight=320, seaLevel=63)
 
-    def generateTile(self, chunk: ChunkData) -> None:
+    def generateTile(self, chunk: Union[ChunkData, CompactChunkData]) -> None:
         tileMap = {}
-        heightMap = {}
-        blockDataMap = {}
-        blocks = chunk.blocks
-        
-        tilesPath = WORLDS_DIR / chunk.dimension / "tiles" / "zoom-4"
-        tilesPath.mkdir(parents=True, exist_ok=True)
+        for (tileX, tileY), grid in self._groupBlocks(chunk).items():
+            tileKey = (chunk.dimension, self._baseZoom, tileX, tileY)
+            tileImage = self._loadTile(tileKey)
+
+            with metrics.timed("mipmap_render_stage_seconds", stage="shade"):
+                tileMap[tileKey] = self._renderBlocks(tileImage, grid)
+
+        self._saveTiles(tileMap)
+
+    def applyColumns(self, update: ColumnUpdate) -> None:
+        grid, renderMask = self._groupColumns(update)
+        if not grid[0]:
+            return
+
+        tileKey = (update.dimension, self._baseZoom, update.chunkX, update.chunkZ)
+        tileImage = self._renderBlocks(self._loadTile(tileKey), grid, renderMask)
+
+        self._saveTiles({tileKey: tileImage})
+
+    def _groupColumns(self, update: ColumnUpdate) -> tuple:
+        cells = self._tileSize // self._blockSize
+
+        palette = {}
+        indices = np.zeros((cells, cells), dtype=np.int64)
+        heights = np.zeros((cells, cells), dtype=np.int64)
+        mask = np.zeros((cells, cells), dtype=bool)
+        renderMask = np.zeros((cells, cells), dtype=bool)
 
-        for block in blocks:
+        for column in update.columns:
+            indices[column.z, column.x] = palette.setdefault(column.name, len(palette))
+            heights[column.z, column.x] = column.height
+            mask[column.z, column.x] = True
+            renderMask[column.z, column.x] = not column.context
+
+        return (list(palette), indices, heights, mask), renderMask
+
+    def _groupBlocks(self, chunk: Union[ChunkData, CompactChunkData]) -> dict:
+        cells = self._tileSize // self._blockSize
+
+        if isinstance(chunk, CompactChunkData):
+            mask = np.ones((cells, cells), dtype=bool)
+            grid = (chunk.palette, chunk.indices.astype(np.int64), chunk.heights.astype(np.int64), mask)
+            return {(chunk.chunkX, chunk.chunkZ): grid}
+        tileBlocks = {}
+
+        for block in chunk.blocks:
             tileX = (block.x * self._blockSize) // self._tileSize
             tileY = (block.z * self._blockSize) // self._tileSize
             tileKey = (tileX, tileY)
 
-            tileBlockX = (block.x * self._blockSize) % self._tileSize
-            tileBlockY = (block.z * self._blockSize) % self._tileSize
-
-            if tileKey not in tileMap:
-                tilePath = tilesPath / f"({tileX})-({tileY}).png"
-                tileMap[tileKey] = self._loadTile(tilePath)
-                heightMap[tileKey] = {}
-                blockDataMap[tileKey] = {}
-
-            blockKey = (tileBlockX, tileBlockY)
-            heightMap[tileKey][blockKey] = block.y
-            blockDataMap[tileKey][blockKey] = block
-
-        for tileKey in tileMap.keys():
-            for blockKey, block in blockDataMap[tileKey].items():
-                texture = self._textureLoader.getTexture(block)
-                
-                heightTexture = self._applyHeightShading(
-                    texture, 
-                    block.y, 
-                    blockKey,
-                    heightMap[tileKey]
-                )
-                
-                tileMap[tileKey].paste(heightTexture, blockKey)
-
-        self._saveTiles(tileMap, tilesPath)
-
-    def _loadTile(self, tilePath: Path) -> Image.Image:
-        if tilePath.exists():
-            return Image.open(tilePath)
-        else:
-            return Image.new("RGBA", (self._tileSize, self._tileSize), (0, 0, 0, 0))
+            cellX = (block.x * self._blockSize) % self._tileSize // self._blockSize
+            cellY = (block.z * self._blockSize) % self._tileSize // self._blockSize
 
-    def _applyHeightShading(self, texture: Image.Image, height: int, blockPos: tuple, heightMap: dict) -> Image.Image:
-        shadedTexture = texture.copy()
-        
-        if height < self._seaLevel:
-            depth_factor = (self._seaLevel - height) / (self._seaLevel - self._minHeight)
-            brightness = 0.3 + (1 - depth_factor) * 0.5
-            shadedTexture = self._adjustBrightness(shadedTexture, brightness)
-            
-            blue_intensity = int(depth_factor * 80)
-            shadedTexture = self._addColorTint(shadedTexture, (0, 30, blue_intensity, 40))
-            
-        elif height < 100:
-            brightness = 0.9
-            shadedTexture = self._adjustBrightness(shadedTexture, brightness)
-            
-        elif height < 150:
-            brightness = 1.0 + (height - 100) / 50 * 0.2
-            shadedTexture = self._adjustBrightness(shadedTexture, brightness)
-            
+            tileBlocks.setdefault(tileKey, {})[(cellX, cellY)] = block
+
+        grids = {}
+        for tileKey, blocks in tileBlocks.items():
+            palette = {}
+            indices = np.zeros((cells, cells), dtype=np.int64)
+            heights = np.zeros((cells, cells), dtype=np.int64)
+            mask = np.zeros((cells, cells), dtype=bool)
+
+            for (cellX, cellY), block in blocks.items():
+                indices[cellY, cellX] = palette.setdefault(block.name, len(palette))
+                heights[cellY, cellX] = block.y
+                mask[cellY, cellX] = True
+
+            grids[tileKey] = (list(palette), indices, heights, mask)
+
+        return grids
+
+    def _renderBlocks(self, tileImage: Image.Image, grid: tuple, renderMask: Optional[np.ndarray] = None) -> Image.Image:
+        cells = self._tileSize // self._blockSize
+        palette, indices, heights, mask = grid
+
+        atlas = np.stack([self._textureLoader.getTexture(name) for name in palette])
+        shaded = self._shader.shade(atlas[indices], heights, mask)
+
+        tilePixels = np.array(tileImage.convert("RGBA"))
+        tileCells = tilePixels.reshape(cells, self._blockSize, cells, self._blockSize, 4).transpose(0, 2, 1, 3, 4)
+        writeMask = mask if renderMask is None else mask & renderMask
+        tileCells[writeMask] = shaded[writeMask]
+
+        return Image.fromarray(tilePixels)
+
+    def _loadTile(self, tileKey: TileKey) -> Image.Image:
+        with metrics.timed("mipmap_render_stage_seconds", stage="load"):
+            return self._readTile(tileKey)
+
+    def _readTile(self, tileKey: TileKey) -> Image.Image:
+        if self._tileCache is not None:
+            tileImage = self._tileCache.get(tileKey)
+            if tileImage is not None:
+                return tileImage
+
+        data = self._tileStore.read(tileKey)
+        if data is not None:
+            return decodeTile(data)
         else:
-            mountain_factor = (height - 150) / (self._maxHeight - 150)
-            brightness = 1.2 + mountain_factor * 0.3
-            shadedTexture = self._adjustBrightness(shadedTexture, brightness)
-            
-            if height > 200:
-                whiteness = min(mountain_factor * 0.4, 0.4)
-                white_alpha = int(whiteness * 120)
-                shadedTexture = self._addColorTint(shadedTexture, (255, 255, 255, white_alpha))
-        
-        aoFactor = self._calculateAmbientOcclusion(blockPos, height, heightMap)
-        shadedTexture = self._adjustBrightness(shadedTexture, aoFactor)
-        
-        lightingFactor = self._calculateDirectionalLighting(blockPos, height, heightMap)
-        shadedTexture = self._adjustBrightness(shadedTexture, lightingFactor)
-        
-        if height % 20 == 0 and height > self._minHeight:
-            shadedTexture = self._addContourLine(shadedTexture)
-        
-        return shadedTexture
-    
-    def _calculateAmbientOcclusion(self, blockPos: tuple, height: int, heightMap: dict) -> float:
-        x, y = blockPos
-        neighbors = [
-            (x - self._blockSize, y),
-            (x + self._blockSize, y),
-            (x, y - self._blockSize),
-            (x, y + self._blockSize),
-            (x - self._blockSize, y - self._blockSize),
-            (x + self._blockSize, y - self._blockSize),
-            (x - self._blockSize, y + self._blockSize),
-            (x + self._blockSize, y + self._blockSize),
-        ]
-        
-        occlusion = 0
-        validNeighbors = 0
-        
-        for nx, ny in neighbors:
-            if (nx, ny) in heightMap:
-                neighborHeight = heightMap[(nx, ny)]
-                heightDiff = neighborHeight - height
-                
-                if heightDiff > 0:
-                    occlusion += min(heightDiff / 10.0, 0.15)
-
-                elif heightDiff < 0:
-                    occlusion -= min(abs(heightDiff) / 20.0, 0.05)
-                
-                validNeighbors += 1
-        
-        if validNeighbors > 0:
-            occlusion /= validNeighbors
-        
-        return max(0.6, min(1.2, 1.0 - occlusion))
-    
-    def _calculateDirectionalLighting(self, blockPos: tuple, height: int, heightMap: dict) -> float:
-        x, y = blockPos
-        
-        lightDirection = [
-            (x - self._blockSize, y - self._blockSize),
-            (x - self._blockSize, y),
-            (x, y - self._blockSize),
-        ]
-        
-        shadowFactor = 0
-        
-        for nx, ny in lightDirection:
-            if (nx, ny) in heightMap:
-                neighborHeight = heightMap[(nx, ny)]
-                heightDiff = neighborHeight - height
-                
-                if heightDiff > 0:
-                    shadowFactor += min(heightDiff / 8.0, 0.2)
-        
-        return max(0.7, 1.0 - shadowFactor / len(lightDirection))
-    
-    def _addContourLine(self, texture: Image.Image) -> Image.Image:
-        contour = Image.new("RGBA", texture.size, (0, 0, 0, 30))
-        if texture.mode != "RGBA":
-            texture = texture.convert("RGBA")
-            
-        return Image.alpha_composite(texture, contour)
+            return Image.new("RGBA", (self._tileSize, self._tileSize), (0, 0, 0, 0))
     
-    def _adjustBrightness(self, image: Image.Image, factor: float) -> Image.Image:
-        if image.mode != "RGBA":
-            image = image.convert("RGBA")
+    def _saveTiles(self, tileMap: dict) -> None:
+        if self._tileCache is None:
+            writeTiles(self._tileStore, tileMap)
+            return
 
-        enhancer = ImageEnhance.Brightness(image)
-        return enhancer.enhance(factor)
-    
-    def _addColorTint(self, image: Image.Image, tint_color: tuple) -> Image.Image:
-        tint = Image.new("RGBA", image.size, tint_color)
-        
-        if image.mode != "RGBA":
-            image = image.convert("RGBA")
-        
-        return Image.alpha_composite(image, tint)
-    
-    def _saveTiles(self, tileMap: dict, tilesPath: Path) -> None:
         for tileKey, tileImage in tileMap.items():
-            tileX, tileY = tileKey
-            tilePath = tilesPath / f"({tileX})-({tileY}).png"
-            tileImage.save(tilePath)
\ No newline at end of file
+            self._tileCache.put(tileKey, tileImage)
+
+
+class OverviewRenderer(TileRenderer):
+    def __init__(self, maxZoom: int = 2, tileStore: Optional[TileStore] = None, tileCache: Optional[TileCache] = None):
+        super().__init__(tileStore, tileCache)
+        self._maxZoom = maxZoom
+
+    def generateTile(self, chunk: Union[ChunkData, CompactChunkData]) -> None:
+        cells = self._tileSize // self._blockSize
+
+        for chunkKey, grid in self._groupBlocks(chunk).items():
+            palette, indices, heights, mask = grid
+
+            with metrics.timed("mipmap_render_stage_seconds", stage="shade"):
+                atlas = np.stack([self._textureLoader.getAverageColor(name) for name in palette])
+                colors = self._shader.shade(atlas[indices], heights, mask).reshape(cells, cells, 4)
+
+            for zoom in range(self._maxZoom, -1, -1):
+                self._writeZoom(chunk.dimension, chunkKey, colors, mask, zoom)
+
+    def applyColumns(self, update: ColumnUpdate) -> None:
+        cells = self._tileSize // self._blockSize
+
+        (palette, indices, heights, mask), renderMask = self._groupColumns(update)
+        if not palette:
+            return
+
+        atlas = np.stack([self._textureLoader.getAverageColor(name) for name in palette])
+        colors = self._shader.shade(atlas[indices], heights, mask).reshape(cells, cells, 4)
+
+        for zoom in range(self._maxZoom, -1, -1):
+            self._writeZoom(update.dimension, (update.chunkX, update.chunkZ), colors, mask & renderMask, zoom)
+
+    def _writeZoom(self, dimension: str, chunkKey: tuple, colors: np.ndarray, mask: np.ndarray, zoom: int) -> None:
+        chunkX, chunkZ = chunkKey
+        chunksPerTile = 2 ** (self._baseZoom - zoom)
+        pixelsPerBlock = self._blockSize // chunksPerTile
+        chunkPixels = self._tileSize // chunksPerTile
+
+        tileX, tileY = chunkX // chunksPerTile, chunkZ // chunksPerTile
+        offsetX = (chunkX % chunksPerTile) * chunkPixels
+        offsetY = (chunkZ % chunksPerTile) * chunkPixels
+
+        tileKey = (dimension, zoom, tileX, tileY)
+        tileImage = self._loadTile(tileKey)
+        tilePixels = np.array(tileImage.convert("RGBA"))
+
+        scaledColors = colors.repeat(pixelsPerBlock, axis=0).repeat(pixelsPerBlock, axis=1)
+        scaledMask = mask.repeat(pixelsPerBlock, axis=0).repeat(pixelsPerBlock, axis=1)
+
+        region = tilePixels[offsetY:offsetY + chunkPixels, offsetX:offsetX + chunkPixels]
+        region[scaledMask] = scaledColors[scaledMask]
+
+        self._saveTiles({tileKey: Image.fromarray(tilePixels)})
\ No newline at end of file
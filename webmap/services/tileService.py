@@ -1,49 +1,215 @@
+import time
+import zlib
 import queue
+import signal
 
 import multiprocessing as mp
+
+from typing import List, Optional
 from multiprocessing import Queue, Process
 
-from .tileGenerator import TileRenderer
+from core.config import RENDER_MODE, OVERVIEW_MAX_ZOOM, RENDER_CACHE_TILES, RENDER_FLUSH_INTERVAL, RENDER_RING_SLOTS, RENDER_RING_SLOT_BYTES
+from core.logging import getLogger
+
+from models.chunk import ChunkData, CompactChunkData, ColumnUpdate
+
+from .chunkRing import ChunkRing
+
+from .dirtyTiles import DirtyTileJournal
+from .freshness import traceQueue
+from .metrics import metrics, metricsQueue
+from .tileCache import TileCache
+from .tileGenerator import TileRenderer, OverviewRenderer
+from .tileStore import TileStore, createTileStore
+
+
+logger = getLogger(__name__)
+
+
+def createRenderer(tileStore: Optional[TileStore] = None, tileCache: Optional[TileCache] = None) -> TileRenderer:
+    if RENDER_MODE == "overview":
+        return OverviewRenderer(maxZoom=OVERVIEW_MAX_ZOOM, tileStore=tileStore, tileCache=tileCache)
+
+    return TileRenderer(tileStore, tileCache)
+
+
+def savedTraces(traces: List[tuple]) -> List[tuple]:
+    savedAt = time.time()
+    return [(chunkKey, trace + [savedAt]) for chunkKey, trace in traces]
 
 
-def tileWorker(taskQueue):
-    tile = TileRenderer()
-    while True:
-        try:
-            chunk_data: dict = taskQueue.get(timeout=5)
-            if chunk_data is None:
-                break
+def tileWorker(taskQueue, renderedQueue, chunkRing: ChunkRing, metricsQueue, traceQueue):
+    # Ctrl+C and service managers signal the whole process group; workers
+    # stop on the None task sent by stopWorkers so the cache is flushed first.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    # Counts inherited from the web server process belong to it.
+    metrics.reset()
+
+    onWritten = None
+    if RENDER_MODE == "textured":
+        onWritten = DirtyTileJournal().markTiles
+
+    tileStore = createTileStore()
+    tileCache = TileCache(tileStore, RENDER_CACHE_TILES, RENDER_FLUSH_INTERVAL, onWritten)
+    tile = createRenderer(tileStore, tileCache)
+    rendered = []
+    traces = []
+
+    try:
+        while True:
+            try:
+                task = taskQueue.get(timeout=RENDER_FLUSH_INTERVAL)
+                if task is None:
+                    break
+
+                chunk_data, trace, fingerprint = task
+                renderStarted = time.time()
+
+                if isinstance(chunk_data, tuple):
+                    chunk_data = CompactChunkData.fromBytes(chunkRing.take(*chunk_data))
+                    
+                if isinstance(chunk_data, ColumnUpdate):
+                    tile.applyColumns(chunk_data)
+                else:
+                    tile.generateTile(chunk_data)
+                    rendered.append((chunk_data.chunkKey, fingerprint))
+                    metrics.inc("mipmap_chunks_rendered_total")
+
+                    if trace is not None:
+                        traces.append((chunk_data.chunkKey, trace + [renderStarted]))
                 
-            tile.generateTile(chunk_data)
-            
-        except queue.Empty:
-            continue
+            except queue.Empty:
+                pass
+
+            except Exception:
+                # One bad chunk must not take the worker and its cached tiles down.
+                logger.exception("Error rendering a chunk")
+
+            if tileCache.flushDue():
+                tileCache.flush()
+
+            # A chunk counts as rendered once none of its tiles wait in memory;
+            # only then is its fingerprint saved here and in the plugin, so a crash
+            # before the flush leaves it to be drawn the next time it is sent.
+            if rendered and not tileCache.dirtyTiles:
+                renderedQueue.put(rendered)
+                rendered = []
+
+                if traces:
+                    traceQueue.put(("saved", savedTraces(traces)))
+                    traces = []
+
+            metrics.publish(metricsQueue)
+
+    finally:
+        tileCache.flush()
+        if rendered:
+            renderedQueue.put(rendered)
+        if traces:
+            traceQueue.put(("saved", savedTraces(traces)))
+
+        metrics.publish(metricsQueue, interval=0)
+
+
+def shardShift() -> int:
+    # Overview chunks are drawn into every zoom level down to 0, where one tile
+    # holds 16x16 chunks, so the whole zoom-0 tile has to stay on one worker.
+    if RENDER_MODE == "overview":
+        return 4
+
+    return 0
 
 
 class TileQueueManager:
     def __init__(self, maxWorkers=None):
         self.workers = []
-        self.tileQueue = Queue()
         self.maxWorkers = maxWorkers or min(4, mp.cpu_count())
+        self.tileQueues = [Queue() for _ in range(self.maxWorkers)]
+        self.renderedQueue = Queue()
+        self.chunkRings = [ChunkRing(RENDER_RING_SLOTS, RENDER_RING_SLOT_BYTES) for _ in range(self.maxWorkers)]
+        self.ringFallbacks = 0
+        self.shardShift = shardShift()
         
     def startWorkers(self):
-        for _ in range(self.maxWorkers):
-            worker = Process(target=tileWorker, args=(self.tileQueue,))
-            worker.start()
+        for shard in range(self.maxWorkers):
+            self.workers.append(self._startWorker(shard))
+
+    def _startWorker(self, shard: int) -> Process:
+        worker = Process(target=tileWorker, args=(self.tileQueues[shard], self.renderedQueue, self.chunkRings[shard], metricsQueue, traceQueue))
+        worker.start()
+
+        return worker
+
+    def restartDeadWorkers(self):
+        for shard, worker in enumerate(self.workers):
+            if worker.is_alive():
+                continue
+
+            # A killed worker may hold its queue's read lock, so the replacement
+            # gets a fresh queue and buffer. The lost chunks were never reported
+            # rendered, so no fingerprint skips them the next time they are sent.
+            lost = self.tileQueues[shard].qsize()
+            self.tileQueues[shard].cancel_join_thread()
+            self.tileQueues[shard] = Queue()
+            self.chunkRings[shard] = ChunkRing(RENDER_RING_SLOTS, RENDER_RING_SLOT_BYTES)
 
-            self.workers.append(worker)
+            logger.error(f"Render worker {shard} exited with code {worker.exitcode}, restarting it ({lost} queued tasks dropped)")
+            self.workers[shard] = self._startWorker(shard)
     
     def stopWorkers(self):
-        for _ in self.workers:
-            self.tileQueue.put(None)
+        for tileQueue in self.tileQueues:
+            tileQueue.put(None)
 
         for worker in self.workers:
             worker.join(timeout=10)
             if worker.is_alive():
-                worker.terminate()
+                worker.kill()
         
         self.workers.clear()
     
-    def addTask(self, chunk_data):
-        self.tileQueue.put(chunk_data)
-        return self.tileQueue.qsize()
\ No newline at end of file
+    def shardOf(self, chunkKey: tuple) -> int:
+        dimension, chunkX, chunkZ = chunkKey
+        tileKey = f"{dimension}:{chunkX >> self.shardShift}:{chunkZ >> self.shardShift}"
+
+        return zlib.crc32(tileKey.encode("utf-8")) % len(self.tileQueues)
+
+    def addTask(self, chunk_data, trace: Optional[list] = None, fingerprint: Optional[str] = None):
+        shard = self.shardOf(chunk_data.chunkKey)
+        self.tileQueues[shard].put((self._handoff(shard, chunk_data), trace, fingerprint))
+        return self.queueSize()
+
+    def _handoff(self, shard: int, task):
+        if isinstance(task, ChunkData):
+            task = task.toCompact() or task
+
+        if not isinstance(task, CompactChunkData):
+            return task
+
+        # Whole chunks travel through shared memory; only the slot goes through the queue.
+        descriptor = self.chunkRings[shard].put(task.toBytes())
+        if descriptor is not None:
+            return descriptor
+
+        self.ringFallbacks += 1
+        metrics.inc("mipmap_render_ring_fallbacks_total")
+        if self.ringFallbacks % 1000 == 1:
+            logger.warning(f"Render worker {shard} shared buffer is full, passing chunks through its queue ({self.ringFallbacks} so far)")
+
+        return task
+
+    def queueSize(self):
+        return sum(self.queueSizes())
+
+    def queueSizes(self) -> List[int]:
+        return [tileQueue.qsize() for tileQueue in self.tileQueues]
+
+    def takeRendered(self) -> List[tuple]:
+        rendered = []
+
+        while True:
+            try:
+                rendered.extend(self.renderedQueue.get_nowait())
+            except queue.Empty:
+                return rendered
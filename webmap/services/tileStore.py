@@ -0,0 +1,213 @@
+import io
+import os
+import time
+import sqlite3
+import threading
+
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+
+from core.config import TILE_STORE, TILE_FORMAT, TILE_WEBP_QUALITY, WORLDS_DIR
+
+
+TileKey = Tuple[str, int, int, int]
+
+TILE_EXTENSIONS = {"png": ".png", "webp": ".webp", "webp-lossless": ".webp"}
+
+
+def encodeTile(tileImage: Image.Image, tileFormat: str = TILE_FORMAT, optimize: bool = False) -> bytes:
+    buffer = io.BytesIO()
+
+    if tileFormat == "webp":
+        tileImage.save(buffer, format="WEBP", quality=TILE_WEBP_QUALITY)
+    elif tileFormat == "webp-lossless":
+        tileImage.save(buffer, format="WEBP", lossless=True)
+    else:
+        tileImage.save(buffer, format="PNG", optimize=optimize)
+
+    return buffer.getvalue()
+
+
+def decodeTile(data: bytes) -> Image.Image:
+    tileImage = Image.open(io.BytesIO(data))
+    tileImage.load()
+
+    return tileImage
+
+
+def tileMediaType(data: bytes) -> str:
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+
+    return "image/png"
+
+
+def transcodeTile(data: bytes, tileFormat: str) -> bytes:
+    return encodeTile(decodeTile(data), tileFormat)
+
+
+class TileStore(ABC):
+    @abstractmethod
+    def read(self, tileKey: TileKey) -> Optional[bytes]:
+        pass
+
+    @abstractmethod
+    def readVersioned(self, tileKey: TileKey) -> Optional[Tuple[bytes, int]]:
+        pass
+
+    @abstractmethod
+    def version(self, tileKey: TileKey) -> Optional[int]:
+        pass
+
+    def write(self, tileKey: TileKey, data: bytes) -> None:
+        self.writeMany({tileKey: data})
+
+    @abstractmethod
+    def writeMany(self, tiles: Dict[TileKey, bytes]) -> None:
+        pass
+
+    @abstractmethod
+    def delete(self, tileKey: TileKey) -> None:
+        pass
+
+    @abstractmethod
+    def listTiles(self, dimension: str, zoom: int) -> List[Tuple[int, int]]:
+        pass
+
+    @abstractmethod
+    def listDimensions(self) -> List[str]:
+        pass
+
+
+class DirectoryTileStore(TileStore):
+    def __init__(self, root: Path = WORLDS_DIR, tileFormat: str = TILE_FORMAT):
+        self.root = root
+        self.extension = TILE_EXTENSIONS.get(tileFormat, ".png")
+
+    def _path(self, tileKey: TileKey) -> Path:
+        dimension, zoom, x, y = tileKey
+        return self.root / dimension / "tiles" / f"zoom-{zoom}" / f"({x})-({y}){self.extension}"
+
+    def read(self, tileKey: TileKey) -> Optional[bytes]:
+        try:
+            with open(self._path(tileKey), "rb") as f:
+                return f.read()
+
+        except FileNotFoundError:
+            return None
+
+    def readVersioned(self, tileKey: TileKey) -> Optional[Tuple[bytes, int]]:
+        try:
+            with open(self._path(tileKey), "rb") as f:
+                return f.read(), os.fstat(f.fileno()).st_mtime_ns // 1000
+
+        except FileNotFoundError:
+            return None
+
+    def version(self, tileKey: TileKey) -> Optional[int]:
+        try:
+            return os.stat(self._path(tileKey)).st_mtime_ns // 1000
+
+        except FileNotFoundError:
+            return None
+
+    def writeMany(self, tiles: Dict[TileKey, bytes]) -> None:
+        for tileKey, data in tiles.items():
+            tilePath = self._path(tileKey)
+            tilePath.parent.mkdir(parents=True, exist_ok=True)
+
+            # Readers must never see a half-written PNG.
+            tempPath = tilePath.with_name(f".{tilePath.name}.{os.getpid()}.tmp")
+            with open(tempPath, "wb") as f:
+                f.write(data)
+
+            os.replace(tempPath, tilePath)
+
+    def delete(self, tileKey: TileKey) -> None:
+        self._path(tileKey).unlink(missing_ok=True)
+
+    def listTiles(self, dimension: str, zoom: int) -> List[Tuple[int, int]]:
+        tileCoords = []
+
+        for tilePath in (self.root / dimension / "tiles" / f"zoom-{zoom}").glob(f"*{self.extension}"):
+            try:
+                x, y = map(lambda s: int(s.strip("()")), tilePath.stem.split(")-("))
+                tileCoords.append((x, y))
+
+            except:
+                continue
+
+        return tileCoords
+
+    def listDimensions(self) -> List[str]:
+        return [path.parent.name for path in self.root.glob("*/tiles") if path.is_dir()]
+
+
+class SqliteTileStore(TileStore):
+    def __init__(self, path: Path = WORLDS_DIR / "tiles.db"):
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS tiles ("
+            "dimension TEXT NOT NULL, zoom INTEGER NOT NULL, x INTEGER NOT NULL, y INTEGER NOT NULL, "
+            "data BLOB NOT NULL, updatedAt REAL NOT NULL, "
+            "PRIMARY KEY (dimension, zoom, x, y)) WITHOUT ROWID"
+        )
+        self._connection.commit()
+
+    def read(self, tileKey: TileKey) -> Optional[bytes]:
+        tile = self.readVersioned(tileKey)
+        return tile[0] if tile is not None else None
+
+    def readVersioned(self, tileKey: TileKey) -> Optional[Tuple[bytes, int]]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT data, updatedAt FROM tiles WHERE dimension = ? AND zoom = ? AND x = ? AND y = ?", tileKey
+            ).fetchone()
+
+        return (row[0], round(row[1] * 1e6)) if row is not None else None
+
+    def version(self, tileKey: TileKey) -> Optional[int]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT updatedAt FROM tiles WHERE dimension = ? AND zoom = ? AND x = ? AND y = ?", tileKey
+            ).fetchone()
+
+        return round(row[0] * 1e6) if row is not None else None
+
+    def writeMany(self, tiles: Dict[TileKey, bytes]) -> None:
+        updatedAt = time.time()
+
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO tiles (dimension, zoom, x, y, data, updatedAt) VALUES (?, ?, ?, ?, ?, ?)",
+                [(*tileKey, data, updatedAt) for tileKey, data in tiles.items()]
+            )
+
+    def delete(self, tileKey: TileKey) -> None:
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM tiles WHERE dimension = ? AND zoom = ? AND x = ? AND y = ?", tileKey)
+
+    def listTiles(self, dimension: str, zoom: int) -> List[Tuple[int, int]]:
+        with self._lock:
+            return self._connection.execute(
+                "SELECT x, y FROM tiles WHERE dimension = ? AND zoom = ?", (dimension, zoom)
+            ).fetchall()
+
+    def listDimensions(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._connection.execute("SELECT DISTINCT dimension FROM tiles")]
+
+
+def createTileStore(storeType: str = TILE_STORE, tileFormat: str = TILE_FORMAT) -> TileStore:
+    if storeType == "sqlite":
+        return SqliteTileStore()
+
+    return DirectoryTileStore(tileFormat=tileFormat)
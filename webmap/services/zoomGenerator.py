@@ -1,111 +1,254 @@
+import os
 import time
+import signal
+
+import numpy as np
 
-from pathlib import Path
 from PIL import Image
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
 
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from multiprocessing import Process
 
-from core.config import GENERATE_ZOOM_INTERVAL, WORLDS_DIR
+from core.config import ZOOM_UPDATE_DEBOUNCE, ZOOM_FILTER, ZOOM_WORKERS, ZOOM_PNG_OPTIMIZE
 from core.logging import getLogger
 
+from .dirtyTiles import DirtyTileJournal
+from .freshness import traceQueue
+from .metrics import metrics, metricsQueue
+from .tileStore import TileKey, createTileStore, decodeTile, encodeTile
+
 
 logger = getLogger(__name__)
 
 
-def zoomWorker(interval: int):
+def zoomWorker(debounce: float, metricsQueue, traceQueue):
+    # ZoomManager.stop terminates the process; the handlers inherited from
+    # the web server on fork would keep it running until it is killed.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    metrics.reset()
+
     generator = ZoomGenerator()
+    journal = DirtyTileJournal()
+
+    # Anything rendered before this point is covered by the full pass.
+    dirtyTiles = journal.take()
     generator.generateZooms()
-    
+    traceQueue.put(("zoomed", time.time(), dirtyTiles))
+    metrics.publish(metricsQueue, interval=0)
+
     while True:
-        time.sleep(interval)
-        generator.generateZooms()
+        time.sleep(debounce)
+
+        dirtyTiles = journal.take()
+        if dirtyTiles:
+            generator.updateZooms(dirtyTiles)
+            traceQueue.put(("zoomed", time.time(), dirtyTiles))
+            metrics.publish(metricsQueue, interval=0)
+
+
+def buildSubtree(dimension: str, rootX: int, rootY: int, leaves: List[Tuple[int, int]], zoomFilter: str) -> Tuple[Optional[np.ndarray], dict]:
+    # Pool processes hand their counts back with the result.
+    metrics.reset()
+    root = ZoomGenerator(zoomFilter)._buildSubtree(dimension, rootX, rootY, leaves)
+
+    return root, metrics.takeDelta()
 
 
 class ZoomGenerator:
-    def __init__(self):
+    def __init__(self, zoomFilter: str = ZOOM_FILTER, workers: int = ZOOM_WORKERS):
         self._tileSize = 256
         self._baseZoom = 4
         self._minZoom = 0
         self._zoomLevels = 5
+        self._subtreeZoom = 1
         self._dimensions = ["Overworld", "Nether", "TheEnd"]
-    
+        self._filter = zoomFilter
+        self._workers = workers or os.cpu_count()
+        self._tileStore = createTileStore()
+
     def generateZooms(self):
-        logger.info("Starting zoom generation...")
-        
+        logger.info(f"Starting zoom generation ({self._workers} workers, {self._filter} filter)...")
+        started = time.monotonic()
+        targetZoom = max(self._minZoom, self._baseZoom - self._zoomLevels + 1)
+
         for dimension in self._dimensions:
-            dimensionPath = WORLDS_DIR / dimension / "tiles"
-            dimensionPath.mkdir(parents=True, exist_ok=True)
-            
             logger.info(f"Generating zooms for {dimension}...")
-            targetZoom = max(self._minZoom, self._baseZoom - self._zoomLevels + 1)
-            
+
+            subtreeShift = self._baseZoom - self._subtreeZoom
+            subtrees: Dict[Tuple[int, int], List[Tuple[int, int]]] = {}
+
+            for x, y in self._tileStore.listTiles(dimension, self._baseZoom):
+                subtrees.setdefault((x >> subtreeShift, y >> subtreeShift), []).append((x, y))
+
+            roots = self._buildSubtrees(dimension, subtrees)
+
+            for zoom in range(self._subtreeZoom - 1, targetZoom - 1, -1):
+                roots = self._buildLevel(dimension, roots, zoom)
+
+        metrics.observe("mipmap_zoom_duration_seconds", time.monotonic() - started, kind="full")
+        logger.info(f"Zoom generation completed ({self._zoomLevels} levels) in {time.monotonic() - started:.1f}s")
+
+    def updateZooms(self, dirtyTiles: Iterable[Tuple[str, int, int]]):
+        started = time.monotonic()
+        targetZoom = max(self._minZoom, self._baseZoom - self._zoomLevels + 1)
+
+        tilesByDimension = {}
+        for dimension, x, y in dirtyTiles:
+            tilesByDimension.setdefault(dimension, set()).add((x, y))
+
+        updated = 0
+        for dimension, tileCoords in tilesByDimension.items():
             for zoom in range(self._baseZoom - 1, targetZoom - 1, -1):
-                self._generateZoomLevel(zoom, dimensionPath)
-        
-        logger.info(f"Zoom generation completed ({self._zoomLevels} levels)")
-    
-    def _generateZoomLevel(self, zoom: int, basePath: Path):
-        sourceZoom = zoom + 1
-        sourcePath = basePath / f"zoom-{sourceZoom}"
-        targetPath = basePath / f"zoom-{zoom}"
-        
-        sourcePath.mkdir(parents=True, exist_ok=True)
-        targetPath.mkdir(parents=True, exist_ok=True)
-        
-        sourceTiles = list(sourcePath.glob("*.png"))
-        tileCoords = set()
-        
-        for tilePath in sourceTiles:
-            name = tilePath.stem
-            try:
-                x, y = map(lambda s: int(s.strip("()")), name.split(")-("))
-                tileCoords.add((x // 2, y // 2))
-
-            except:
-                continue
-        
-        for targetX, targetY in tileCoords:
-            self._generateTile(targetX, targetY, zoom, sourcePath, targetPath)
-        
-        logger.info(f"Generated {len(tileCoords)} tiles for zoom level {zoom}")
-    
-    def _generateTile(self, x: int, y: int, zoom: int, sourcePath: Path, targetPath: Path):
-        targetImage = Image.new("RGBA", (self._tileSize, self._tileSize), (0, 0, 0, 0))
-        
+                tileCoords = {(x // 2, y // 2) for x, y in tileCoords}
+
+                self._storeTiles({
+                    (dimension, zoom, x, y): self._encodeTile(self._generateTile(dimension, zoom, x, y))
+                    for x, y in tileCoords
+                })
+
+                updated += len(tileCoords)
+
+        metrics.observe("mipmap_zoom_duration_seconds", time.monotonic() - started, kind="update")
+        logger.info(f"Updated {updated} zoom tiles in {time.monotonic() - started:.2f}s")
+
+    def _buildSubtrees(self, dimension: str, subtrees: Dict[Tuple[int, int], List[Tuple[int, int]]]) -> Dict[Tuple[int, int], np.ndarray]:
+        roots = {}
+        total = len(subtrees)
+        logStep = max(1, total // 10)
+
+        with ProcessPoolExecutor(max_workers=self._workers) as pool:
+            futures = {
+                pool.submit(buildSubtree, dimension, rootX, rootY, leaves, self._filter): (rootX, rootY)
+                for (rootX, rootY), leaves in subtrees.items()
+            }
+
+            for done, future in enumerate(as_completed(futures), 1):
+                try:
+                    root, delta = future.result()
+                    metrics.merge(delta)
+
+                    if root is not None:
+                        roots[futures[future]] = root
+
+                except Exception as e:
+                    logger.error(f"Error building zoom subtree {futures[future]} in {dimension}: {e}")
+
+                if done % logStep == 0 or done == total:
+                    logger.info(f"{dimension}: {done}/{total} subtrees ({done / total * 100:.0f}%)")
+
+        return roots
+
+    def _buildSubtree(self, dimension: str, rootX: int, rootY: int, leaves: List[Tuple[int, int]]) -> Optional[np.ndarray]:
+        tiles = {}
+        for x, y in leaves:
+            tile = self._readTile((dimension, self._baseZoom, x, y))
+            if tile is not None:
+                tiles[(x, y)] = tile
+
+        for zoom in range(self._baseZoom - 1, self._subtreeZoom - 1, -1):
+            tiles = self._buildLevel(dimension, tiles, zoom)
+
+        return tiles.get((rootX, rootY))
+
+    def _buildLevel(self, dimension: str, children: Dict[Tuple[int, int], np.ndarray], zoom: int) -> Dict[Tuple[int, int], np.ndarray]:
+        grouped: Dict[Tuple[int, int], Dict[Tuple[int, int], np.ndarray]] = {}
+        for (x, y), tile in children.items():
+            grouped.setdefault((x // 2, y // 2), {})[(x % 2, y % 2)] = tile
+
+        parents = {}
+        encoded = {}
+        for (x, y), quadrants in grouped.items():
+            tileKey = (dimension, zoom, x, y)
+            tile = self._composeTile(quadrants)
+            encoded[tileKey] = self._encodeTile(tile)
+
+            if encoded[tileKey] is not None:
+                parents[(x, y)] = tile
+
+        self._storeTiles(encoded)
+
+        return parents
+
+    def _generateTile(self, dimension: str, zoom: int, x: int, y: int) -> np.ndarray:
+        quadrants = {}
+
         for dx in range(2):
             for dy in range(2):
-                sourceX = x * 2 + dx
-                sourceY = y * 2 + dy
-                sourceTilePath = sourcePath / f"({sourceX})-({sourceY}).png"
-                
-                if sourceTilePath.exists():
-                    try:
-                        sourceImage = Image.open(sourceTilePath)
-                        resized = sourceImage.resize((self._tileSize // 2, self._tileSize // 2), Image.Resampling.LANCZOS)
-                        targetImage.paste(resized, (dx * self._tileSize // 2, dy * self._tileSize // 2))
-
-                    except Exception as e:
-                        logger.error(f"Error processing tile {sourceTilePath}: {e}")
-        
+                tile = self._readTile((dimension, zoom + 1, x * 2 + dx, y * 2 + dy))
+                if tile is not None:
+                    quadrants[(dx, dy)] = tile
+
+        return self._composeTile(quadrants)
+
+    def _readTile(self, tileKey: TileKey) -> Optional[np.ndarray]:
+        data = self._tileStore.read(tileKey)
+        if data is None:
+            return None
+
+        try:
+            return np.array(decodeTile(data).convert("RGBA"))
+
+        except Exception as e:
+            logger.error(f"Error processing tile {tileKey}: {e}")
+            return None
+
+    def _encodeTile(self, tile: np.ndarray) -> Optional[bytes]:
+        targetImage = Image.fromarray(tile)
+
         if targetImage.getbbox():
-            targetTilePath = targetPath / f"({x})-({y}).png"
-            targetImage.save(targetTilePath, optimize=True)
+            return encodeTile(targetImage, optimize=ZOOM_PNG_OPTIMIZE)
+
+        return None
+
+    def _storeTiles(self, tiles: Dict[TileKey, Optional[bytes]]) -> None:
+        written = {tileKey: data for tileKey, data in tiles.items() if data is not None}
+        self._tileStore.writeMany(written)
+
+        for zoom, count in Counter(tileKey[1] for tileKey in written).items():
+            metrics.inc("mipmap_zoom_tiles_total", count, zoom=zoom)
+        metrics.inc("mipmap_tile_bytes_written_total", sum(map(len, written.values())), source="zoom")
+
+        for tileKey, data in tiles.items():
+            if data is None:
+                self._tileStore.delete(tileKey)
+
+    def _composeTile(self, quadrants: Dict[Tuple[int, int], np.ndarray]) -> np.ndarray:
+        half = self._tileSize // 2
+        tile = np.zeros((self._tileSize, self._tileSize, 4), dtype=np.uint8)
+
+        for (dx, dy), child in quadrants.items():
+            tile[dy * half:(dy + 1) * half, dx * half:(dx + 1) * half] = self._downsample(child)
+
+        return tile
+
+    def _downsample(self, tile: np.ndarray) -> np.ndarray:
+        half = self._tileSize // 2
+        image = Image.fromarray(tile)
+
+        if self._filter == "box":
+            return np.array(image.reduce(2))
+
+        return np.array(image.resize((half, half), Image.Resampling.LANCZOS))
 
 
 class ZoomManager:
     def __init__(self):
         self._process = None
-        self._interval = GENERATE_ZOOM_INTERVAL
+        self._debounce = ZOOM_UPDATE_DEBOUNCE
     
     def start(self):
         if self._process and self._process.is_alive():
             logger.warning("Zoom generation process is already running")
             return
         
-        self._process = Process(target=zoomWorker, args=(self._interval,))
+        self._process = Process(target=zoomWorker, args=(self._debounce, metricsQueue, traceQueue))
         self._process.start()
 
-        logger.info(f"Zoom generation process started (interval: {self._interval}s)")
+        logger.info(f"Zoom generation process started (debounce: {self._debounce}s)")
     
     def stop(self):
         if self._process and self._process.is_alive():
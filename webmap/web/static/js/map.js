@@ -3,6 +3,7 @@ class MipMapViewer {
     this.config = {
       minZoom: 0,
       maxZoom: 4,
+      maxNativeZoom: 4,
       tileSize: 256,
       updateInterval: 5000,
       defaultWorld: "Overworld",
@@ -14,6 +15,7 @@ class MipMapViewer {
     this.currentTileLayer = null;
     this.playerMarkers = {};
     this.updateTimer = null;
+    this.playerStream = null;
 
     this.elements = {
       coords: document.getElementById("coords"),
@@ -39,6 +41,7 @@ class MipMapViewer {
       this.config.mapSize = serverConfig.mapSize || this.config.mapSize;
       this.config.updateInterval = serverConfig.updateInterval || this.config.updateInterval;
       this.config.defaultWorld = serverConfig.defaultWorld || this.config.defaultWorld;
+      this.config.maxNativeZoom = serverConfig.maxNativeZoom ?? this.config.maxNativeZoom;
       this.currentWorld = this.config.defaultWorld;
     } catch (error) {
       console.error("Ошибка загрузки конфигурации:", error);
@@ -69,6 +72,7 @@ class MipMapViewer {
       {
         minZoom: this.config.minZoom,
         maxZoom: this.config.maxZoom,
+        maxNativeZoom: this.config.maxNativeZoom,
         tileSize: this.config.tileSize,
         noWrap: true,
         continuousWorld: true,
@@ -140,6 +144,27 @@ class MipMapViewer {
     }
   }
 
+  applyPlayerDeltas(deltas) {
+    deltas.forEach((delta) => {
+      if (delta.type === "join") {
+        this.updatePlayerMarkers([delta.player]);
+        return;
+      }
+
+      const marker = this.playerMarkers[delta.name];
+      if (!marker) return;
+
+      if (delta.type === "quit") {
+        marker.remove();
+        delete this.playerMarkers[delta.name];
+        return;
+      }
+
+      const { type, ...changes } = delta;
+      this.updatePlayerMarkers([{ ...marker.playerData, ...changes }]);
+    });
+  }
+
   removeDisconnectedPlayers(activePlayers) {
     const activeNames = new Set(activePlayers.map((p) => p.name));
     
@@ -194,8 +219,13 @@ class MipMapViewer {
     });
   }
 
+  skinUrl(player) {
+    const version = player.skin ? `?v=${player.skin}` : "";
+    return `/api/players/${player.name}/skin.png${version}`;
+  }
+
   createPlayerMarker(player) {
-    const iconUrl = `/api/players/${player.name}/skin.png`;
+    const iconUrl = this.skinUrl(player);
     const fallbackLetter = player.name ? player.name[0].toUpperCase() : "?";
     
     const icon = L.divIcon({
@@ -227,7 +257,7 @@ class MipMapViewer {
     return `
       <div class="player-popup">
         <div class="player-header">
-          <img src="/api/players/${player.name}/skin.png" 
+          <img src="${this.skinUrl(player)}" 
                class="popup-avatar" 
                width="32" 
                height="32"
@@ -253,13 +283,47 @@ class MipMapViewer {
   }
 
   startPlayerUpdates() {
+    if (!window.EventSource) {
+      this.startPolling();
+      return;
+    }
+
+    this.playerStream = new EventSource("/api/players/stream");
+
+    this.playerStream.addEventListener("snapshot", (e) => {
+      const players = JSON.parse(e.data);
+
+      this.stopPolling();
+      this.removeDisconnectedPlayers(players);
+      this.updatePlayerMarkers(players);
+    });
+
+    this.playerStream.addEventListener("delta", (e) => {
+      this.applyPlayerDeltas(JSON.parse(e.data));
+    });
+
+    // The browser reconnects on its own; poll until the next snapshot arrives.
+    this.playerStream.onerror = () => this.startPolling();
+  }
+
+  startPolling() {
+    if (this.updateTimer) return;
+
     this.updatePlayers();
     this.updateTimer = setInterval(() => this.updatePlayers(), this.config.updateInterval);
   }
 
-  destroy() {
+  stopPolling() {
     if (this.updateTimer) {
       clearInterval(this.updateTimer);
+      this.updateTimer = null;
+    }
+  }
+
+  destroy() {
+    this.stopPolling();
+    if (this.playerStream) {
+      this.playerStream.close();
     }
     if (this.map) {
       this.map.remove();